@@ -0,0 +1,69 @@
+"""
+Benchmark for loading the static lookup tables.
+
+Compares the cost of importing PyYAML and parsing each table from YAML with loading the
+JSON tables compiled by build.py through load_lookup().
+
+Usage:
+    python benchmarks/bench_lookup.py [--repeat 200]
+"""
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+src_folder = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, src_folder)
+
+import yaml  # noqa: E402
+from WeatherSkill import load_lookup  # noqa: E402
+
+TABLES = [
+    os.path.join(src_folder, "WeatherSkill", "weather_conditions"),
+    os.path.join(src_folder, "WatcherSkill", "plurals")
+]
+
+
+def timed(func, count):
+    start = time.perf_counter()
+    for i in range(count):
+        func()
+
+    return (time.perf_counter() - start) / count * 1e3
+
+
+def yaml_import_time():
+    # Measured in a new interpreter since the module is already imported here
+    code = "import time; t = time.perf_counter(); import yaml; print(time.perf_counter() - t)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(result.stdout) * 1e3
+
+
+def load_yaml(file_name):
+    with open(f"{file_name}.yml", "r", encoding="UTF-8") as fp:
+        return {str(k): v for k, v in yaml.safe_load(fp).items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="YAML vs JSON lookup table load benchmark")
+    parser.add_argument("--repeat", type=int, default=200, help="Number of loads per table")
+    args = parser.parse_args()
+
+    print(f"import yaml:              {yaml_import_time():8.2f} ms")
+
+    for file_name in TABLES:
+        if not os.path.isfile(f"{file_name}.json"):
+            print(f"{file_name}.json not found.  Run build.py first.")
+            continue
+
+        assert load_lookup(file_name) == load_yaml(file_name), f"{file_name}.json is out of date.  Run build.py."
+
+        name = os.path.basename(file_name)
+        print(f"{name + ' (yaml):':<26}{timed(lambda: load_yaml(file_name), args.repeat):8.3f} ms")
+        print(f"{name + ' (json):':<26}{timed(lambda: load_lookup(file_name), args.repeat):8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
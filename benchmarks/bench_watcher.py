@@ -0,0 +1,80 @@
+"""
+Benchmark for WatcherSkill detection tracking.
+
+Drives update_camera() with synthetic high-frequency kenzy.image updates from a number of
+cameras and then times location queries over the detection history.
+
+Usage:
+    python benchmarks/bench_watcher.py [--cameras 16] [--objects 30] [--updates 20000]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import WatcherSkill  # noqa: E402
+
+NAMES = ["person", "dog", "cat", "car", "bicycle", "chair", "cup", "bottle"]
+
+
+class FakeService(object):
+    def __init__(self, remote_devices):
+        self.remote_devices = remote_devices
+
+
+class FakeDevice(object):
+    def __init__(self, remote_devices):
+        self.service = FakeService(remote_devices)
+        self.data = {}
+
+
+def timed(func, count):
+    start = time.perf_counter()
+    for i in range(count):
+        func(i)
+
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WatcherSkill detection tracking benchmark")
+    parser.add_argument("--cameras", type=int, default=16, help="Number of cameras")
+    parser.add_argument("--locations", type=int, default=4, help="Number of locations the cameras are spread across")
+    parser.add_argument("--objects", type=int, default=30, help="Objects per update")
+    parser.add_argument("--updates", type=int, default=20000, help="Number of updates")
+    parser.add_argument("--queries", type=int, default=2000, help="Number of queries per query type")
+    args = parser.parse_args()
+
+    random.seed(0)
+    cameras = [f"http://camera{i}:9700" for i in range(args.cameras)]
+    remote_devices = {url: {"location": f"room{i % args.locations}"} for i, url in enumerate(cameras)}
+
+    skill = WatcherSkill.create_skill()
+    skill.device = FakeDevice(remote_devices)
+
+    messages = [
+        {"objects": [{"name": random.choice(NAMES)} for _ in range(args.objects)], "motion": True}
+        for _ in range(100)
+    ]
+
+    print(f"{args.cameras} cameras, {args.objects} objects per update, {args.updates} updates")
+    print(f"update_camera:          {timed(lambda i: skill.update_camera(cameras[i % len(cameras)], messages[i % 100]), args.updates):8.1f} us/update")
+    print(f"location now:           {timed(lambda i: skill.get_location_counts('room1'), args.queries):8.1f} us/query")
+    print(f"location last 10 min:   {timed(lambda i: skill.get_location_counts('room1', 600), args.queries):8.1f} us/query")
+    print(f"location last hour:     {timed(lambda i: skill.get_location_counts('room1', 3600), args.queries):8.1f} us/query")
+
+    # A full hour of history at the default 60 second buckets
+    history = WatcherSkill.DetectionHistory()
+    now = time.time()
+    for i in range(3600):
+        history.record({name: random.randint(0, 5) for name in NAMES}, now - 3600 + i)
+
+    print(f"DetectionHistory.query: {timed(lambda i: history.query(3600, now), args.queries):8.1f} us/query (1 hour, {len(NAMES)} objects)")
+
+
+if __name__ == "__main__":
+    main()
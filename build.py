@@ -4,6 +4,7 @@ import shutil
 from pathlib import Path
 import json
 import zipfile
+import yaml
 
 fldr = os.path.dirname(__file__)
 source_folder = os.path.join(fldr, "src")
@@ -13,6 +14,14 @@ src_fldr = os.path.normpath(os.path.join(fldr, "..", "kenzy"))
 sys.path.insert(0, os.path.join(src_fldr, "src"))
 sys.path.insert(0, source_folder)
 
+# Compile static YAML lookup tables to JSON so skills do not need to import PyYAML at runtime
+for yml_file in sorted(Path(source_folder).rglob("*.yml")):
+    with open(yml_file, "r", encoding="UTF-8") as fp:
+        lookup = yaml.safe_load(fp)
+
+    with open(yml_file.with_suffix(".json"), "w", encoding="UTF-8") as sw:
+        json.dump({str(k): v for k, v in lookup.items()}, sw, indent=4)
+
 inventory = {}
 with open(os.path.join(os.path.dirname(__file__), "README.md"), "w", encoding="UTF-8") as ks:
     ks.write("# KENZY.Ai Skills &middot; [![GitHub license](https://img.shields.io/github/license/lnxusr1/kenzy-skills)](https://github.com/lnxusr1/kenzy-skills/blob/master/LICENSE) ![Python Versions](https://img.shields.io/pypi/pyversions/yt2mp3.svg)\n\n")
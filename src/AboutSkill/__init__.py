@@ -1,7 +1,83 @@
-from statistics import mean 
+import math
+import time
+import threading
+from array import array
+from urllib.parse import urlparse
 from kenzy import GenericSkill
 
 
+class MetricsBuffer(object):
+    """
+    Fixed size ring buffer of timestamped samples for one metric
+    """
+
+    def __init__(self, size=120):
+        """
+        Metrics Buffer Initialization
+
+        Args:
+            size (int): Number of samples to keep
+        """
+
+        self.size = size
+        self._times = array("d", [0.0] * size)
+        self._values = array("d", [0.0] * size)
+        self._count = 0
+        self._pos = 0
+
+    def add(self, value, timestamp):
+        """
+        Adds a sample, replacing the oldest one once the buffer is full.
+
+        Args:
+            value (float): Sample value
+            timestamp (float): Time the sample was taken
+        """
+
+        self._times[self._pos] = timestamp
+        self._values[self._pos] = value
+        self._pos = (self._pos + 1) % self.size
+        self._count = min(self._count + 1, self.size)
+
+    def values(self, seconds, timestamp):
+        """
+        Gets the samples taken during a time window.
+
+        Args:
+            seconds (float): Length of the window ending at timestamp
+            timestamp (float): End of the window
+
+        Returns:
+            (list): Sample values in the window
+        """
+
+        start = timestamp - seconds
+        return [self._values[i] for i in range(self._count) if self._times[i] >= start]
+
+    def summary(self, seconds, timestamp):
+        """
+        Gets the mean, max and 95th percentile of the samples taken during a time window.
+
+        Args:
+            seconds (float): Length of the window ending at timestamp
+            timestamp (float): End of the window
+
+        Returns:
+            (dict): Keys of mean, max, p95 and samples or None if the window is empty
+        """
+
+        values = sorted(self.values(seconds, timestamp))
+        if len(values) == 0:
+            return None
+
+        return {
+            "mean": sum(values) / len(values),
+            "max": values[-1],
+            "p95": values[int(math.ceil(0.95 * len(values))) - 1],
+            "samples": len(values)
+        }
+
+
 class AboutSkill(GenericSkill):
     """
     Skill provide "About" Information
@@ -18,6 +94,26 @@ class AboutSkill(GenericSkill):
         self.description = "Info about KENZY"
         self._version = [1, 0, 0]
 
+        self.metrics_interval = 30
+        self.metrics_window = 300
+        self.metrics_size = 120
+
+        # Cluster wide average (warning) and single node (critical) utilization limits in percent
+        self.cpu_warning = 50
+        self.cpu_critical = 85
+        self.memory_warning = 70
+        self.memory_critical = 90
+        self.hysteresis = 5
+        self.node_names = {}
+
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._summary = {}
+        self._report = None
+        self._alerts = set()
+        self._stop_event = threading.Event()
+        self.thread = None
+
         self.logger.debug(f"{self.name} loaded successfully.")
 
     def initialize(self):
@@ -33,8 +129,233 @@ class AboutSkill(GenericSkill):
         self.register_intent_file("real.intent", self.handle_real_intent)
         self.register_intent_file("human.intent", self.handle_human_intent)
         self.register_intent_file("maker.intent", self.handle_maker_intent)
+
+        self.metrics_interval = float(self.get_setting("metrics_interval", 30))
+        self.metrics_window = float(self.get_setting("metrics_window", 300))
+        self.metrics_size = int(self.get_setting("metrics_size", 120))
+
+        self.cpu_warning = float(self.get_setting("cpu_warning", 50))
+        self.cpu_critical = float(self.get_setting("cpu_critical", 85))
+        self.memory_warning = float(self.get_setting("memory_warning", 70))
+        self.memory_critical = float(self.get_setting("memory_critical", 90))
+        self.hysteresis = float(self.get_setting("hysteresis", 5))
+
+        self.node_names = self.get_setting("node_names", {})
+        if not isinstance(self.node_names, dict):
+            self.node_names = {}
+
+        self._stop_event.clear()
+        self.thread = threading.Thread(target=self.start_collector, daemon=True)
+        self.thread.start()
+
         return True
 
+    def get_device_metrics(self, status):
+        """
+        Gets the CPU and memory utilization of every device in a status message.
+
+        Args:
+            status (dict): Data from the device status request
+
+        Returns:
+            (dict): Device name to dict with keys of cpu and memory (percent or None)
+        """
+
+        def get_pcts(info):
+            info = info.get("info", {}) if isinstance(info, dict) else {}
+            return {
+                "cpu": info.get("cpu", {}).get("percent"),
+                "memory": info.get("memory", {}).get("virtual", {}).get("percent")
+            }
+
+        result = {str(status.get("url", "local")): get_pcts(status)}
+
+        devs = status.get("data", {}).get("devices", [])
+        if isinstance(devs, dict):
+            for item in devs:
+                result[str(item)] = get_pcts(devs.get(item))
+        else:
+            for idx, item in enumerate(devs):
+                name = item.get("url", str(idx)) if isinstance(item, dict) else str(idx)
+                result[str(name)] = get_pcts(item)
+
+        return result
+
+    def collect_metrics(self):
+        """
+        Samples the CPU and memory utilization of every device and updates the summary.
+        """
+
+        status = self.device.status().data
+        now = time.time()
+
+        with self._lock:
+            for name, pcts in self.get_device_metrics(status).items():
+                if name not in self._metrics:
+                    self._metrics[name] = {
+                        "cpu": MetricsBuffer(self.metrics_size),
+                        "memory": MetricsBuffer(self.metrics_size)
+                    }
+
+                for metric in pcts:
+                    if pcts.get(metric) is not None:
+                        self._metrics[name][metric].add(float(pcts.get(metric)), now)
+
+        summary = self.get_metrics_summary()
+        with self._lock:
+            self._summary = summary
+            self._report = self.build_health_report(summary)
+
+    def get_metrics_summary(self, seconds=None):
+        """
+        Gets the CPU and memory utilization of every device over a time window.
+
+        Args:
+            seconds (float): Length of the window ending now (defaults to metrics_window)
+
+        Returns:
+            (dict): Device name to dict with keys of cpu and memory, each a dict of mean, max, p95 and samples
+        """
+
+        seconds = self.metrics_window if seconds is None else seconds
+        now = time.time()
+
+        result = {}
+        with self._lock:
+            for name in self._metrics:
+                result[name] = {metric: buf.summary(seconds, now) for metric, buf in self._metrics[name].items()}
+
+        return result
+
+    def get_node_name(self, name):
+        """
+        Gets the spoken name of a device.
+
+        Args:
+            name (str): Device name from the metrics summary (usually its URL)
+
+        Returns:
+            (str): Name from the node_names setting or else the host name of the device
+        """
+
+        if name in self.node_names:
+            return str(self.node_names.get(name))
+
+        host = urlparse(name).hostname
+        return host if host is not None else name
+
+    def is_alert(self, key, value, threshold):
+        """
+        Checks a value against its threshold.  Once raised an alert stays active until the value
+        drops below the threshold minus the hysteresis so that a value hovering at the limit does
+        not flip back and forth.
+
+        Args:
+            key (tuple): Unique key of the alert
+            value (float): Current value or None if unknown
+            threshold (float): Threshold that raises the alert
+
+        Returns:
+            (bool): True if the alert is active
+        """
+
+        if value is None:
+            self._alerts.discard(key)
+            return False
+
+        if value > threshold or (key in self._alerts and value > threshold - self.hysteresis):
+            self._alerts.add(key)
+            return True
+
+        self._alerts.discard(key)
+        return False
+
+    def build_health_report(self, summary):
+        """
+        Builds the health report for a metrics summary and updates the active alerts.
+
+        Args:
+            summary (dict): Output of get_metrics_summary()
+
+        Returns:
+            (dict): Health report (see get_health_report)
+        """
+
+        devices = []
+        for name, metrics in summary.items():
+            cpu = metrics.get("cpu", {}).get("p95") if metrics.get("cpu") is not None else None
+            memory = metrics.get("memory", {}).get("p95") if metrics.get("memory") is not None else None
+
+            devices.append({
+                "device": name,
+                "name": self.get_node_name(name),
+                "cpu": cpu,
+                "memory": memory,
+                "pressure": max(
+                    (cpu or 0) / self.cpu_critical if self.cpu_critical > 0 else 0,
+                    (memory or 0) / self.memory_critical if self.memory_critical > 0 else 0
+                ),
+                "high_cpu": self.is_alert((name, "cpu"), cpu, self.cpu_critical),
+                "high_memory": self.is_alert((name, "memory"), memory, self.memory_critical)
+            })
+
+        devices.sort(key=lambda x: x.get("pressure"), reverse=True)
+
+        cpu_means = [x["cpu"]["mean"] for x in summary.values() if x.get("cpu") is not None]
+        mem_means = [x["memory"]["mean"] for x in summary.values() if x.get("memory") is not None]
+        cpu = sum(cpu_means) / len(cpu_means) if len(cpu_means) > 0 else None
+        memory = sum(mem_means) / len(mem_means) if len(mem_means) > 0 else None
+
+        return {
+            "timestamp": time.time(),
+            "cluster": {
+                "cpu": cpu,
+                "memory": memory,
+                "high_cpu": self.is_alert(("cluster", "cpu"), cpu, self.cpu_warning),
+                "high_memory": self.is_alert(("cluster", "memory"), memory, self.memory_warning)
+            },
+            "devices": devices
+        }
+
+    def get_health_report(self):
+        """
+        Gets the latest health report of all devices for use by this or other skills.
+
+        Returns:
+            (dict): Keys of timestamp, cluster and devices or None if no metrics are collected yet.
+                cluster holds the average cpu and memory percent with high_cpu and high_memory alerts.
+                devices is a list sorted from highest to lowest pressure where each item holds the
+                device, spoken name, 95th percentile cpu and memory percent, pressure (1.0 = at the
+                critical threshold) and the high_cpu and high_memory alerts for that device.
+        """
+
+        with self._lock:
+            report = self._report
+
+        if report is None:
+            try:
+                self.collect_metrics()
+            except Exception:
+                self.logger.error("Unable to collect device metrics.")
+
+            with self._lock:
+                report = self._report
+
+        return report
+
+    def start_collector(self):
+        """
+        Background thread for sampling device metrics every metrics_interval seconds.
+        """
+
+        while not self._stop_event.is_set():
+            try:
+                self.collect_metrics()
+            except Exception:
+                self.logger.debug("Unable to collect device metrics.", exc_info=True)
+
+            self._stop_event.wait(self.metrics_interval)
+
     def handle_who_intent(self, message, context=None, **kwargs):
         """
         Primary function for intent matches.  Called by skill manager.
@@ -67,65 +388,74 @@ class AboutSkill(GenericSkill):
             (bool): True on success or False on failure
         """
         
-        status = self.device.status().data
-
-        cpu_pcts = [status.get("info", {}).get("cpu", {}).get("percent")]
-        mem_pcts = [status.get("info", {}).get("memory", {}).get("virtual", {}).get("percent")]
+        report = self.get_health_report()
+        if report is not None:
+            text = self.get_health_text(report)
+            if text is not None:
+                return self.say(text, context=context)
 
-        devs = status.get("data", {}).get("devices", [])
-        for item in devs:
-            cpu_pcts.append(devs.get(item).get("info", {}).get("cpu", {}).get("percent"))
-            mem_pcts.append(devs.get(item).get("info", {}).get("memory", {}).get("virtual", {}).get("percent"))
+        text = self.getMessageFromDialog("status.dialog")
+        if (text != ""):
+            return self.say(text, context=context)
 
+        return False
 
-        high_cpu = False
-        single_cpu = False
-        cpu_pct = 0
+    def get_health_text(self, report):
+        """
+        Builds the spoken answer for a health report.
 
-        high_mem = False
-        single_mem = False
-        mem_pct = 0
+        Args:
+            report (dict): Output of get_health_report()
 
-        if mean(cpu_pcts) > 50:
-            high_cpu = True
-            cpu_pct = mean(cpu_pcts)
-        elif max(cpu_pcts) > 85:
-            single_cpu = True
-            cpu_pct = max(cpu_pcts)
+        Returns:
+            (str): Text to speak or None if everything is running normally
+        """
 
-        if mean(mem_pcts) > 70:
-            high_mem = True
-            mem_pct = mean(mem_pcts)
+        cluster = report.get("cluster", {})
+        high_cpu = cluster.get("high_cpu")
+        high_mem = cluster.get("high_memory")
 
-        elif max(mem_pcts) > 90:
-            single_mem = True
-            mem_pct = max(mem_pcts)
+        # Devices are ranked by pressure so the first match is the most overloaded node
+        cpu_node = next((x for x in report.get("devices", []) if x.get("high_cpu")), None)
+        mem_node = next((x for x in report.get("devices", []) if x.get("high_memory")), None)
 
         if high_cpu:
             if high_mem:
-                return self.say("My Sea Pee You cores and memory utilization are both running higher than normal.", context=context)
-            elif single_mem:
-                return self.say("My Sea Pee You cores are running higher than usual, and I have a node that has higher than expected memory utilization.", context=context)
+                text = "My Sea Pee You cores and memory utilization are both running higher than normal."
+                node = next((x for x in report.get("devices", []) if x.get("high_cpu") or x.get("high_memory")), None)
+                if node is not None:
+                    text = f"{text}  My {node['name']} node is the most heavily loaded."
+                return text
+            elif cpu_node is not None and mem_node is not None:
+                return f"My Sea Pee You cores are running higher than usual, especially on my {cpu_node['name']} node, " \
+                       f"and my {mem_node['name']} node has higher than expected memory utilization."
+            elif mem_node is not None:
+                return f"My Sea Pee You cores are running higher than usual, and my {mem_node['name']} node has higher than expected memory utilization."
+            elif cpu_node is not None:
+                return f"My Sea Pee You cores are running higher than usual, especially on my {cpu_node['name']} node, but otherwise I'm okay."
             else:
-                return self.say("My Sea Pee You cores are running higher than usual, but otherwise I'm okay.", context=context)
-        elif single_cpu:
+                return "My Sea Pee You cores are running higher than usual, but otherwise I'm okay."
+        elif cpu_node is not None:
             if high_mem:
-                return self.say("My virtual memory is being used at a higher than normal rate and I have a node that has a higher than expected Sea Pee You utilization.", context=context)
-            elif single_mem:
-                return self.say("I have a node that seems to be over allocated.", context=context)
+                text = f"My virtual memory is being used at a higher than normal rate and my {cpu_node['name']} node has high Sea Pee You utilization."
+                if mem_node is not None:
+                    text = f"{text}  My {mem_node['name']} node is using {str(int(mem_node.get('memory')))} percent of its virtual memory."
+                return text
+            elif mem_node is not None and mem_node.get("device") == cpu_node.get("device"):
+                return f"My {cpu_node['name']} node seems to be over allocated."
+            elif mem_node is not None:
+                return f"My {cpu_node['name']} node is running high on Sea Pee You and my {mem_node['name']} node is running high on memory."
             else:
-                return self.say("I have a node that is processing a significant amount of data, but otherwise I'm okay.", context=context)
-        else:
-            if high_mem:
-                return self.say(f"My virtual memory seems to be over allocated as it has only {str(100 - int(mem_pct))} percent remaining.", context=context)
-            elif single_mem:
-                return self.say(f"I have a node that is using {str(int(mem_pct))} percent of its virtual memory.", context=context)
-
-        text = self.getMessageFromDialog("status.dialog")
-        if (text != ""):
-            return self.say(text, context=context)
+                return f"My {cpu_node['name']} node is processing a significant amount of data, but otherwise I'm okay."
+        elif high_mem:
+            text = f"My virtual memory seems to be over allocated as it has only {str(100 - int(cluster.get('memory')))} percent remaining."
+            if mem_node is not None:
+                text = f"{text}  My {mem_node['name']} node is using {str(int(mem_node.get('memory')))} percent of its virtual memory."
+            return text
+        elif mem_node is not None:
+            return f"My {mem_node['name']} node is using {str(int(mem_node.get('memory')))} percent of its virtual memory."
 
-        return False
+        return None
 
     def handle_real_intent(self, message, context=None, **kwargs):
         """
@@ -194,6 +524,12 @@ class AboutSkill(GenericSkill):
         Returns:
             (bool):  True on success and False on failure
         """
+
+        self._stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
         return True
         
     
@@ -1,12 +1,26 @@
 import os
+import shutil
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import tempfile
 import json
+import hashlib
+import heapq
+import queue
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from kenzy import GenericSkill
 from kenzy.extras import strip_punctuation
 
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+CACHE_VERSION = 1
+
 
 class HomeAssistantSkill(GenericSkill):
     """
@@ -25,18 +39,40 @@ class HomeAssistantSkill(GenericSkill):
         self.area_alias_overrides = {}
 
         self._headers = {}
+        self._session = None
         self._intent_map = {}
+        self._intent_map_hash = None
+        self._entity_index = {}
+        self._refresh_thread = None
+        self._map_lock = threading.RLock()
+        self._areas = None
+        self._states = {}
+        self._live_stop = threading.Event()
+        self._live_thread = None
+        self._ws = None
+        self._ws_id = 0
         self._dev_timers = {}
         self._timer_running = threading.Event()
         self._timer_running.clear()
+        self._timer_cond = threading.Condition()
+        self._timer_heap = []
         self._timer_thread = None
         self._timer_delay = 0
+        self._dispatch_queue = None
+        self._dispatch_lock = threading.Lock()
+        self._dispatch_pending = {}
+        self._dispatch_active = set()
+        self._dispatch_threads = []
         self._triggers = []
+        self._trigger_index = {}
+        self._dev_names = {}
 
-        self._file_lights = os.path.join(tempfile.gettempdir(), "ha_lights")
-        self._file_covers = os.path.join(tempfile.gettempdir(), "ha_covers")
-        self._file_locks = os.path.join(tempfile.gettempdir(), "ha_locks")
-        self._file_areas = os.path.join(tempfile.gettempdir(), "ha_areas")
+        self._workspace = None
+        self._file_lights = None
+        self._file_covers = None
+        self._file_locks = None
+        self._file_areas = None
+        self._file_cache = None
 
         self.name = "HomeAssistantSkill"
         self.description = "Control HomeAssistant lights, fans, covers, and doors"
@@ -59,6 +95,7 @@ class HomeAssistantSkill(GenericSkill):
         self.entity_alias_overrides = self.get_setting("entity_aliases")
         self._timer_delay = self.get_setting("timer_delay", 0.5)
         self._triggers = self.get_setting("triggers", [])
+        self._index_triggers()
 
         if self.url is None or self.token is None:
             return False
@@ -70,13 +107,19 @@ class HomeAssistantSkill(GenericSkill):
             "Content-Type": "application/json"
         }
 
-        self._load_intent_map()
-        self._create_intents_from_map()
+        self._session = self._create_session()
+        self._create_workspace()
+
+        use_cache = str(self.get_setting("cache", "enable")).lower().strip() == "enable"
+        from_cache = use_cache and self._load_cache()
+        if not from_cache:
+            self._load_intent_map()
+            if use_cache:
+                self._save_cache()
 
-        self.register_entity_file(f"{self._file_lights}.entity")
-        self.register_entity_file(f"{self._file_covers}.entity")
-        self.register_entity_file(f"{self._file_locks}.entity")
-        self.register_entity_file(f"{self._file_areas}.entity")
+        with self._map_lock:
+            self._create_intents_from_map()
+            self._register_intents_from_map()
 
         self.register_entity_file("ha_type.entity")
         self.register_entity_file("ha_on_off.entity")
@@ -85,108 +128,511 @@ class HomeAssistantSkill(GenericSkill):
 
         self.register_intent_file("ha_list.intent", self.handle_homeassistant_intent_list)
 
-        if str(self.get_setting("lights", "enable")).lower().strip() == "enable":
-            self.register_intent_file(
-                f"{self._file_lights}.intent",
-                self.handle_homeassistant_intent_lights
-            )
-
-        if str(self.get_setting("covers", "enable")).lower().strip() == "enable":
-            self.register_intent_file(
-                f"{self._file_covers}.intent",
-                self.handle_homeassistant_intent_covers
-            )
-
-        if str(self.get_setting("locks", "enable")).lower().strip() == "enable":
-            self.register_intent_file(
-                f"{self._file_locks}.intent",
-                self.handle_homeassistant_intent_locks
-            )
-
         self.register_type_trigger("kenzy.image", self.handle_homeassistant_image_trigger)
 
+        self._dispatch_queue = queue.Queue(maxsize=int(self.get_setting("trigger_queue_size", 100)))
+        for i in range(0, max(int(self.get_setting("trigger_workers", 2)), 1)):
+            thread = threading.Thread(target=self._dispatch_worker, daemon=True)
+            thread.start()
+            self._dispatch_threads.append(thread)
+
+        self._timer_running.set()
         self._timer_thread = threading.Thread(target=self._image_timer, daemon=True)
         self._timer_thread.start()
 
+        # Background threads that can re-register intents are started only after every registration
+        # above so that they never call into the skill manager at the same time as initialize()
+        if from_cache:
+            # Answer from the cached map right away and check for changes in the background
+            self._refresh_thread = threading.Thread(target=self._refresh_intent_map, daemon=True)
+            self._refresh_thread.start()
+
+        if str(self.get_setting("live_updates", "disable")).lower().strip() == "enable":
+            if websocket is None:
+                self.logger.error("Live updates require the websocket-client package.")
+            else:
+                self._live_stop.clear()
+                self._live_thread = threading.Thread(target=self._live_updates, daemon=True)
+                self._live_thread.start()
+
         self.logger.debug(f"{self.name} initialized.")
         return True
 
-    def _create_type_file(self, types, file_name):
-        device_names = []
+    def _create_workspace(self):
+        """
+        Creates the directory for the generated vocab files.  The directory is named with a key made
+        from the Home Assistant URL and aliases, which is also used to name the cache file, so every
+        start reuses the same directory instead of leaving a new one behind after a crash.  If another
+        running process already owns it then a directory keyed by this process ID is used instead.
+        """
 
-        for type_id in types:
-            for a_alias in self._intent_map.get(type_id):
-                for device_name in self._intent_map.get(type_id).get(a_alias):
+        config = json.dumps([self.url, self.area_alias_overrides, self.entity_alias_overrides], sort_keys=True)
+        key = hashlib.sha256(config.encode("UTF-8")).hexdigest()[:12]
 
-                    if device_name not in device_names:
-                        device_names.append(device_name)
-                        if (device_name.endswith("light") 
-                                or device_name.endswith("fan") 
-                                or device_name.endswith("lamp")) \
-                                and f"{device_name}s" not in device_names:
+        base_dir = tempfile.gettempdir()
+        if str(self.get_setting("vocab_storage", "disk")).lower().strip() == "memory":
+            if os.path.isdir("/dev/shm"):
+                base_dir = "/dev/shm"
+            else:
+                self.logger.debug("No in-memory filesystem available.  Using temp directory for vocab files.")
+
+        # Remove directories left behind by processes that are no longer running
+        prefix = f"kenzy_ha_{key}_"
+        for dir_name in os.listdir(base_dir):
+            if dir_name.startswith(prefix):
+                pid = dir_name[len(prefix):]
+                if not pid.isdigit() or not self._is_running(int(pid)):
+                    shutil.rmtree(os.path.join(base_dir, dir_name), ignore_errors=True)
+
+        self._workspace = os.path.join(base_dir, f"kenzy_ha_{key}")
+        owner = self._get_workspace_owner(self._workspace)
+        if owner is not None and owner != os.getpid() and self._is_running(owner):
+            self._workspace = os.path.join(base_dir, f"{prefix}{os.getpid()}")
+
+        os.makedirs(self._workspace, exist_ok=True)
+        with open(os.path.join(self._workspace, "owner.pid"), "w", encoding="UTF-8") as sw:
+            sw.write(str(os.getpid()))
+
+        self._file_lights = os.path.join(self._workspace, "ha_lights")
+        self._file_covers = os.path.join(self._workspace, "ha_covers")
+        self._file_locks = os.path.join(self._workspace, "ha_locks")
+        self._file_areas = os.path.join(self._workspace, "ha_areas")
+        self._file_cache = os.path.join(tempfile.gettempdir(), f"ha_cache_{key}.json")
+
+    def _get_workspace_owner(self, workspace):
+        """
+        Gets the process ID that owns a vocab file directory.
 
-                            device_names.append(f"{device_name}s")
+        Args:
+            workspace (str): Path of the directory
 
-        with open(file_name, "w", encoding="UTF-8") as sw:
-            for item in device_names:
-                sw.write(item.replace("'", "") + "\n")
+        Returns:
+            (int): Process ID or None if the directory has no owner
+        """
 
-    def _load_intent_map(self):
-        if self.url is None or self.token is None:
+        try:
+            with open(os.path.join(workspace, "owner.pid"), "r", encoding="UTF-8") as fp:
+                return int(fp.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def _is_running(self, pid):
+        """
+        Checks if a process is still running.
+
+        Args:
+            pid (int): Process ID
+
+        Returns:
+            (bool): True if the process exists
+        """
+
+        if os.name == "nt":
+            # Signals cannot be used to probe processes on Windows so ask the kernel for the exit code instead
+            try:
+                import ctypes
+                kernel32 = ctypes.windll.kernel32
+                handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+                if not handle:
+                    return kernel32.GetLastError() == 5  # ERROR_ACCESS_DENIED means it exists
+
+                exit_code = ctypes.c_ulong()
+                try:
+                    if not kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)):
+                        return True
+                finally:
+                    kernel32.CloseHandle(handle)
+
+                return exit_code.value == 259  # STILL_ACTIVE
+            except Exception:
+                return False
+
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
             return False
+        except OSError:
+            return True
 
-        self.logger.debug("Downloading area list...")
-        resp_areas = requests.post(
-            f"{self.url}/api/template",
-            headers=self._headers,
-            timeout=30,
-            json={"template": "{{ areas() }}"}
+        return True
+
+    def _create_session(self):
+        """
+        Creates the shared HTTP session so that connections to Home Assistant are kept alive and reused.
+
+        Returns:
+            (requests.Session): Session with the authorization headers and retry policy attached
+        """
+
+        pool_size = int(self.get_setting("pool_size", 10))
+        # Read timeouts are not retried since the request may already have been acted on
+        retry = Retry(
+            total=int(self.get_setting("retries", 3)),
+            read=0,
+            backoff_factor=float(self.get_setting("retry_backoff", 0.3)),
+            status_forcelist=[502, 503, 504],
+            allowed_methods=None,
+            raise_on_status=False
         )
 
-        if not resp_areas.ok:
-            self.logger.error("Unable to download area list")
-            return False
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
 
-        areas_list = {}
-        for item in json.loads(resp_areas.text.strip().replace("'", "\"")):
-            areas_list[item] = {"alias": None, "devices": []}
+        session = requests.Session()
+        session.headers.update(self._headers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
 
-        for item in areas_list:
-            self.logger.debug(f"Processing area = {item}...")
+    def _get_connection_stats(self):
+        """
+        Counts the requests sent and connections opened by the shared session.
 
-            resp_alias = requests.post(
-                f"{self.url}/api/template",
-                headers=self._headers,
-                timeout=30,
-                json={"template": str("{{ area_name('%s') }}" % item)}
-            )
-            if not resp_alias.ok:
-                self.logger.error("Unable to download area alias")
+        Returns:
+            (dict): Number of requests, new connections, and reused connections
+        """
+
+        stats = {"requests": 0, "connections": 0, "reused": 0}
+        if self._session is None or self.url is None:
+            return stats
+
+        pools = self._session.get_adapter(self.url).poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            stats["requests"] += pool.num_requests
+            stats["connections"] += pool.num_connections
+
+        stats["reused"] = max(stats["requests"] - stats["connections"], 0)
+        return stats
+
+    def _register_intents_from_map(self, changed=None):
+        """
+        Registers the generated vocab files with the intent engine.
+
+        Args:
+            changed (set): Only register these files.  All files are registered if None. (optional)
+        """
+
+        for file_name in [self._file_lights, self._file_covers, self._file_locks, self._file_areas]:
+            if changed is None or f"{file_name}.entity" in changed:
+                self.register_entity_file(f"{file_name}.entity")
+
+        intents = [
+            ("lights", self._file_lights, self.handle_homeassistant_intent_lights),
+            ("covers", self._file_covers, self.handle_homeassistant_intent_covers),
+            ("locks", self._file_locks, self.handle_homeassistant_intent_locks)
+        ]
+
+        for setting_name, file_name, handler in intents:
+            if str(self.get_setting(setting_name, "enable")).lower().strip() != "enable":
+                continue
+
+            if changed is None or f"{file_name}.intent" in changed:
+                self.register_intent_file(f"{file_name}.intent", handler)
+
+    def _set_intent_map(self, intent_map):
+        """
+        Sets the intent map and rebuilds the name index used to find entities regardless of area.
+
+        Args:
+            intent_map (dict): Devices keyed by type, area alias, and name
+        """
+
+        entity_index = {}
+        for type_id in intent_map:
+            names = entity_index.setdefault(type_id, {})
+            for area_alias in intent_map.get(type_id):
+                for name, record in intent_map.get(type_id).get(area_alias).items():
+                    names.setdefault(name, record)
+
+        self._entity_index = entity_index
+        self._intent_map = intent_map
+        self._intent_map_hash = self._get_map_hash(intent_map)
+
+    def _get_map_hash(self, intent_map):
+        return hashlib.sha256(json.dumps(intent_map, sort_keys=True).encode("UTF-8")).hexdigest()
+
+    def _load_cache(self):
+        """
+        Loads the intent map from the cache file saved by a previous run.
+
+        Returns:
+            (bool): True if a valid cache was loaded else False
+        """
+
+        try:
+            if not os.path.isfile(self._file_cache):
                 return False
 
-            areas_list[item]["friendly_name"] = resp_alias.text
-            areas_list[item]["alias"] = resp_alias.text if item not in self.area_alias_overrides else self.area_alias_overrides[item]
+            with open(self._file_cache, "r", encoding="UTF-8") as fp:
+                cache = json.load(fp)
 
-            resp_area_devs = requests.post(
-                f"{self.url}/api/template",
-                headers=self._headers,
-                timeout=30,
-                json={"template": str("{{ area_entities('%s') }}" % item)}
-            )
+            if cache.get("version") != CACHE_VERSION or cache.get("url") != self.url:
+                return False
 
-            if not resp_area_devs.ok:
-                self.logger.error("Unable to download area device list")
+            intent_map = cache.get("intent_map")
+            if not isinstance(intent_map, dict):
                 return False
 
-            areas_list[item]["devices"] = json.loads(
-                resp_area_devs.text.strip().replace("'", "\"")
-            )
+            self._set_intent_map(intent_map)
+
+        except Exception as e:
+            self.logger.error(f"Unable to load intent map cache: {str(e)}")
+            return False
+
+        self.logger.debug("Loaded intent map from cache.")
+        return True
+
+    def _save_cache(self):
+        """
+        Saves the current intent map to the cache file.
+
+        Returns:
+            (bool): True on success else False
+        """
+
+        tmp_file = None
+        try:
+            # The cache is shared by every process with the same settings so each one stages its own file
+            os.makedirs(os.path.dirname(self._file_cache), exist_ok=True)
+            fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(self._file_cache), prefix=os.path.basename(self._file_cache), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="UTF-8") as sw:
+                json.dump({
+                    "version": CACHE_VERSION,
+                    "url": self.url,
+                    "hash": self._intent_map_hash,
+                    "intent_map": self._intent_map
+                }, sw)
+
+            os.replace(tmp_file, self._file_cache)
+
+        except Exception as e:
+            self.logger.error(f"Unable to save intent map cache: {str(e)}")
+            if tmp_file is not None and os.path.isfile(tmp_file):
+                os.remove(tmp_file)
+
+            return False
+
+        return True
+
+    def _refresh_intent_map(self):
+        """
+        Reloads the intent map from Home Assistant and re-registers the intents only if it changed.
+        """
+
+        old_hash = self._intent_map_hash
+
+        try:
+            if not self._load_intent_map():
+                self.logger.error("Unable to refresh intent map.  Using cached values.")
+                return
+
+        except Exception as e:
+            self.logger.error(f"Unable to refresh intent map: {str(e)}.  Using cached values.")
+            return
+
+        self._update_intents(old_hash)
+
+    def _update_intents(self, old_hash):
+        """
+        Saves the intent map and regenerates the intents if it no longer matches the previous hash.
+
+        Args:
+            old_hash (str): Hash of the intent map before it was updated
+        """
+
+        with self._map_lock:
+            if str(self.get_setting("cache", "enable")).lower().strip() == "enable":
+                self._save_cache()
+
+            if self._intent_map_hash == old_hash:
+                self.logger.debug("Intent map unchanged.")
+                return
+
+            self.logger.debug("Intent map changed.  Updating intents.")
+            changed = self._create_intents_from_map()
+            self._register_intents_from_map(changed)
+
+    def get_state(self, entity_id):
+        """
+        Gets the last known state of an entity from the state mirror.
+
+        Args:
+            entity_id (str): Entity ID (e.g. light.office_lamp)
+
+        Returns:
+            (dict): State object as reported by Home Assistant or None if unknown
+        """
+
+        return self._states.get(entity_id)
+
+    def _ws_send(self, msg_type, **kwargs):
+        self._ws_id += 1
+        self._ws.send(json.dumps({"id": self._ws_id, "type": msg_type, **kwargs}))
+        return self._ws_id
+
+    def _live_updates(self):
+        """
+        Keeps a websocket connection to Home Assistant open and applies entity and area
+        changes as they happen.  Reconnects with a backoff if the connection drops.
+        """
+
+        ws_url = self.get_setting("websocket_url", self.url.replace("http", "ws", 1) + "/api/websocket")
+        delay = 1
+
+        while not self._live_stop.is_set():
+            try:
+                self._ws = websocket.create_connection(ws_url, timeout=30)
+                self._ws_id = 0
+
+                json.loads(self._ws.recv())
+                self._ws.send(json.dumps({"type": "auth", "access_token": self.token}))
+                if json.loads(self._ws.recv()).get("type") != "auth_ok":
+                    self.logger.error("Unable to authenticate Home Assistant websocket.")
+                    break
+
+                self._ws.settimeout(None)
+                self._ws_send("subscribe_events", event_type="state_changed")
+                self._ws_send("subscribe_events", event_type="area_registry_updated")
+                self._ws_send("subscribe_events", event_type="entity_registry_updated")
+                states_id = self._ws_send("get_states")
+
+                self.logger.debug("Home Assistant websocket connected.")
+                delay = 1
+
+                while not self._live_stop.is_set():
+                    msg = json.loads(self._ws.recv())
+                    if msg.get("type") == "event":
+                        self._handle_live_event(msg.get("event", {}))
+                    elif msg.get("type") == "result" and msg.get("id") == states_id and msg.get("success"):
+                        self._sync_states(msg.get("result", []))
+
+            except Exception as e:
+                if not self._live_stop.is_set():
+                    self.logger.error(f"Home Assistant websocket error: {str(e)}")
+
+            finally:
+                if self._ws is not None:
+                    self._ws.close()
+
+            self._live_stop.wait(delay)
+            delay = min(delay * 2, 60)
+
+    def _sync_states(self, states):
+        with self._map_lock:
+            old_hash = self._intent_map_hash
+            self._states = {item.get("entity_id"): item for item in states}
+
+            if self._areas is not None:
+                self._build_intent_map()
+                self._update_intents(old_hash)
+
+    def _handle_live_event(self, event):
+        event_type = event.get("event_type")
+        data = event.get("data", {})
+
+        if event_type == "state_changed":
+            entity_id = data.get("entity_id", "")
+            new_state = data.get("new_state")
+            old_state = self._states.get(entity_id)
+
+            if new_state is None:
+                self._states.pop(entity_id, None)
+            else:
+                self._states[entity_id] = new_state
+
+            if entity_id.split(".", 1)[0] not in ["light", "fan", "cover", "lock"]:
+                return
+
+            old_name = (old_state or {}).get("attributes", {}).get("friendly_name")
+            new_name = (new_state or {}).get("attributes", {}).get("friendly_name")
+            if old_state is not None and new_state is not None and old_name == new_name:
+                return
+
+            self.logger.debug(f"Entity changed: {entity_id}")
+
+        elif event_type in ["area_registry_updated", "entity_registry_updated"]:
+            self.logger.debug(f"Registry changed: {event_type}")
+
+            areas_list = None
+            if str(self.get_setting("discovery", "bulk")).lower().strip() == "bulk":
+                areas_list = self._download_areas_bulk()
+
+            if areas_list is None:
+                areas_list = self._download_areas()
+
+            if areas_list is None:
+                return
+
+            self._areas = areas_list
+
+        else:
+            return
+
+        with self._map_lock:
+            if self._areas is not None:
+                old_hash = self._intent_map_hash
+                self._build_intent_map()
+                self._update_intents(old_hash)
+
+    def _write_file(self, file_name, lines):
+        """
+        Writes a vocab file atomically, skipping the write if the content has not changed.
+
+        Args:
+            file_name (str): Path of the file to write
+            lines (list): Lines to write to the file
+
+        Returns:
+            (bool): True if the file was written else False
+        """
+
+        content = "".join([f"{x}\n" for x in lines])
+
+        if os.path.isfile(file_name):
+            with open(file_name, "r", encoding="UTF-8") as fp:
+                if fp.read() == content:
+                    return False
+
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        tmp_file = f"{file_name}.tmp"
+        with open(tmp_file, "w", encoding="UTF-8") as sw:
+            sw.write(content)
+
+        os.replace(tmp_file, file_name)
+        return True
+
+    def _create_type_file(self, types, file_name):
+        device_names = {}
+
+        for type_id in types:
+            for a_alias in self._intent_map.get(type_id):
+                for device_name in self._intent_map.get(type_id).get(a_alias):
+                    device_name = device_name.replace("'", "")
+                    device_names[device_name] = True
+
+                    if device_name.endswith("light") or device_name.endswith("fan") or device_name.endswith("lamp"):
+                        device_names[f"{device_name}s"] = True
+
+        return self._write_file(file_name, list(device_names))
+
+    def _load_intent_map(self):
+        if self.url is None or self.token is None:
+            return False
+
+        areas_list = None
+        if str(self.get_setting("discovery", "bulk")).lower().strip() == "bulk":
+            areas_list = self._download_areas_bulk()
+
+        if areas_list is None:
+            areas_list = self._download_areas()
+
+        if areas_list is None:
+            return False
 
         self.logger.debug("Downloading device list...")
 
-        resp_devs = requests.get(
+        resp_devs = self._session.get(
             f"{self.url}/api/states",
-            headers=self._headers,
             timeout=30
         )
 
@@ -194,22 +640,41 @@ class HomeAssistantSkill(GenericSkill):
             self.logger.error("Unable to download device list")
             return False
 
+        with self._map_lock:
+            self._areas = areas_list
+            self._states = {item.get("entity_id"): item for item in resp_devs.json()}
+            self._build_intent_map()
+
+        self.logger.debug(f"Connection stats: {self._get_connection_stats()}")
+
+        return True
+
+    def _build_intent_map(self):
+        """
+        Builds the intent map from the downloaded areas and the entity state mirror.
+        """
+
+        areas_list = self._areas
+
+        area_by_entity = {}
+        for area_id in areas_list:
+            for entity_id in areas_list.get(area_id).get("devices", []):
+                area_by_entity.setdefault(entity_id, area_id)
+
+        entity_aliases = self.entity_alias_overrides if isinstance(self.entity_alias_overrides, dict) else {}
+
         area_dev_map = {"light": {}, "cover": {}, "lock": {}}
 
-        for item in resp_devs.json():
+        for item in list(self._states.values()):
             entity_id = item.get("entity_id")
             if entity_id.split(".", 1)[0] in ["light", "fan", "cover", "lock"]:
-                friendly_name = item.get("attributes", {}).get("friendly_name")
+                friendly_name = item.get("attributes", {}).get("friendly_name") or entity_id.split(".", 1)[1]
 
-                area_id = None
-                for area in areas_list:
-                    if entity_id in areas_list.get(area).get("devices", []):
-                        area_id = area
-                        break
+                area_id = area_by_entity.get(entity_id)
 
                 entity_name = friendly_name.lower().strip()
                 short_name = entity_name
-                area_alias = areas_list.get(area_id).get("alias", "").replace("'", "").lower()
+                area_alias = str(areas_list.get(area_id, {}).get("alias") or "").replace("'", "").lower()
 
                 if area_id is not None:
                     n = areas_list.get(area_id).get("friendly_name", "").lower()
@@ -219,112 +684,189 @@ class HomeAssistantSkill(GenericSkill):
                         entity_name = entity_name.replace(n, area_alias).strip()
 
                 type_id = entity_id.split(".", 1)[0].lower()
+                map_type = type_id if type_id != "fan" else "light"
 
-                if str(type_id if type_id != "fan" else "light") not in area_dev_map:
-                    area_dev_map[type_id if type_id != "fan" else "light"] = {}
+                short_name = short_name[:-1] if short_name.endswith("lights") or short_name.endswith("fans") or short_name.endswith("lamps") else short_name
 
-                if area_alias not in area_dev_map.get(type_id if type_id != "fan" else "light"):
-                    area_dev_map[type_id if type_id != "fan" else "light"][area_alias] = {}
+                package = area_dev_map.setdefault(map_type, {}).setdefault(area_alias, {})
+
+                short_names = [short_name]
+                aliases = entity_aliases.get(entity_id)
+                if isinstance(aliases, list):
+                    short_names.extend([str(x).lower().strip() for x in aliases])
+                elif aliases is not None:
+                    short_names.append(str(aliases).lower().strip())
+
+                for short_name in short_names:
+                    package[short_name.replace("'", "")] = {
+                        "name": entity_name,
+                        "area_id": area_id,
+                        "entity_id": entity_id,
+                        "friendly_name": friendly_name,
+                        "short_name": short_name,
+                        "type": type_id
+                    }
 
-                short_name = short_name[:-1] if short_name.endswith("lights") or short_name.endswith("fans") or short_name.endswith("lamps") else short_name
+        # self.logger.debug(json.dumps(area_dev_map, indent=4))
+        self._set_intent_map(area_dev_map)
 
-                # package = area_dev_map[type_id]
-                package = area_dev_map[type_id if type_id != "fan" else "light"][area_alias]
+    def _download_areas_bulk(self):
+        """
+        Downloads all areas, their names, and their entities in a single rendered template.
 
-                package[short_name.replace("'", "")] = {
-                    "name": entity_name,
-                    "area_id": area_id,
-                    "entity_id": entity_id,
+        Returns:
+            (dict): Areas keyed by area_id or None if the template could not be rendered
+        """
+
+        self.logger.debug("Downloading area list (bulk)...")
+
+        template = (
+            "{%- set ns = namespace(areas=[]) -%}"
+            "{%- for area_id in areas() -%}"
+            "{%- set ns.areas = ns.areas + [{'id': area_id, 'name': area_name(area_id), 'entities': area_entities(area_id)}] -%}"
+            "{%- endfor -%}"
+            "{{ ns.areas | tojson }}"
+        )
+
+        try:
+            resp = self._session.post(
+                f"{self.url}/api/template",
+                timeout=30,
+                json={"template": template}
+            )
+
+            if not resp.ok:
+                self.logger.debug(f"Bulk area discovery failed: {resp.text}")
+                return None
+
+            areas_list = {}
+            for item in json.loads(resp.text):
+                area_id = item.get("id")
+                friendly_name = str(item.get("name") or "")
+                areas_list[area_id] = {
                     "friendly_name": friendly_name,
-                    "short_name": short_name,
-                    "type": type_id
+                    "alias": friendly_name if area_id not in self.area_alias_overrides else self.area_alias_overrides[area_id],
+                    "devices": list(item.get("entities") or [])
                 }
 
-                if isinstance(self.entity_alias_overrides, dict):
-                    for id in self.entity_alias_overrides:
-                        if id == entity_id:
-                            if isinstance(self.entity_alias_overrides.get(id), list):
-                                for entry in self.entity_alias_overrides.get(id):
-                                    short_name = entry.lower().strip()
-                                    package[short_name.replace("'", "")] = {
-                                        "name": entity_name,
-                                        "area_id": area_id,
-                                        "entity_id": entity_id,
-                                        "friendly_name": friendly_name,
-                                        "short_name": short_name,
-                                        "type": type_id
-                                    }
-                            else:
-                                short_name = self.entity_alias_overrides.get(id).lower().strip()
-                                package[short_name.replace("'", "")] = {
-                                    "name": entity_name,
-                                    "area_id": area_id,
-                                    "entity_id": entity_id,
-                                    "friendly_name": friendly_name,
-                                    "short_name": short_name,
-                                    "type": type_id
-                                }
+        except Exception as e:
+            self.logger.debug(f"Bulk area discovery failed: {str(e)}")
+            return None
 
-        # self.logger.debug(json.dumps(area_dev_map, indent=4))
-        self._intent_map = area_dev_map
+        return areas_list
 
-        return True
+    def _download_areas(self):
+        """
+        Downloads the area list and then each area's name and entities individually.
+
+        Returns:
+            (dict): Areas keyed by area_id or None on failure
+        """
+
+        self.logger.debug("Downloading area list...")
+        resp_areas = self._session.post(
+            f"{self.url}/api/template",
+            timeout=30,
+            json={"template": "{{ areas() }}"}
+        )
+
+        if not resp_areas.ok:
+            self.logger.error("Unable to download area list")
+            return None
+
+        areas_list = {}
+        for item in json.loads(resp_areas.text.strip().replace("'", "\"")):
+            areas_list[item] = {"alias": None, "devices": []}
+
+        for item in areas_list:
+            self.logger.debug(f"Processing area = {item}...")
+
+            resp_alias = self._session.post(
+                f"{self.url}/api/template",
+                timeout=30,
+                json={"template": str("{{ area_name('%s') }}" % item)}
+            )
+            if not resp_alias.ok:
+                self.logger.error("Unable to download area alias")
+                return None
+
+            areas_list[item]["friendly_name"] = resp_alias.text
+            areas_list[item]["alias"] = resp_alias.text if item not in self.area_alias_overrides else self.area_alias_overrides[item]
+
+            resp_area_devs = self._session.post(
+                f"{self.url}/api/template",
+                timeout=30,
+                json={"template": str("{{ area_entities('%s') }}" % item)}
+            )
+
+            if not resp_area_devs.ok:
+                self.logger.error("Unable to download area device list")
+                return None
+
+            areas_list[item]["devices"] = json.loads(
+                resp_area_devs.text.strip().replace("'", "\"")
+            )
+
+        return areas_list
 
     def _create_intents_from_map(self):
-        self._create_entity_for_areas()
-        self._create_intents_from_map_lights()
-        self._create_intents_from_map_locks()
-        self._create_intents_from_map_covers()
+        """
+        Generates the vocab files from the intent map.
 
-    def _create_entity_for_areas(self):
-        areas_list = []
+        Returns:
+            (set): Paths of the files that changed
+        """
+
+        changed = set()
+        changed.update(self._create_entity_for_areas())
+        changed.update(self._create_intents_from_map_lights())
+        changed.update(self._create_intents_from_map_locks())
+        changed.update(self._create_intents_from_map_covers())
+        return changed
 
+    def _create_entity_for_areas(self):
         file_name = f"{self._file_areas}.entity"
-        os.makedirs(os.path.dirname(file_name), exist_ok=True)
-        with open(file_name, "w", encoding="UTF-8") as sw:
-            for area_alias in self._intent_map.get("light"):
-                if area_alias not in areas_list:
-                    areas_list.append(area_alias)
-                    sw.write(area_alias.replace("'", "") + "\n")
+        areas_list = {}
+        for type_id in ["light", "cover"]:
+            for area_alias in self._intent_map.get(type_id):
+                if area_alias != "":
+                    areas_list[area_alias.replace("'", "")] = True
 
-            for area_alias in self._intent_map.get("cover"):
-                if area_alias not in areas_list:
-                    areas_list.append(area_alias)
-                    sw.write(area_alias.replace("'", "") + "\n")
+        return [file_name] if self._write_file(file_name, list(areas_list)) else []
 
-    def _create_intents_from_map_lights(self):
-        file_name = f"{self._file_lights}.intent"
-        os.makedirs(os.path.dirname(file_name), exist_ok=True)
-        with open(file_name, "w", encoding="UTF-8") as sw:
-            sw.write("(please |) turn {ha_on_off} (all |) (the |) {ha_type} (in this |) (room | location | place |)\n")
-            sw.write("(please |) turn {ha_on_off} (all |) (the |) {ha_lights} (in this |) (room | location | place |)\n")
-            sw.write("(please |) turn (all |) (the |) {ha_type} {ha_on_off} (in this |) (room | location | place |)\n")
-            sw.write("(please |) turn (all |) (the |) {ha_lights} {ha_on_off} (in this |) (room | location | place |)\n")
+    def _create_intents(self, intent_lines, types, file_prefix):
+        changed = []
+        if self._write_file(f"{file_prefix}.intent", intent_lines):
+            changed.append(f"{file_prefix}.intent")
 
-            sw.write("(please |) turn {ha_on_off} (all |) (the |) {ha_area} {ha_lights}\n")
-            sw.write("(please |) turn (the |) {ha_area} {ha_lights} (all |) {ha_on_off}\n")
-            sw.write("(please |) turn {ha_on_off} (all |) (the |) {ha_lights} (in | on | under | over | at |) (the |) {ha_area}\n")
-            sw.write("(please |) turn (all |) (the |) {ha_lights} (in | on | under | over | at |) (the |) {ha_area} {ha_on_off}\n")
-            sw.write("(please |) turn (all |) (the |) {ha_lights} {ha_on_off} (in | on | under | over | at |) (the |) {ha_area}\n")
+        if self._create_type_file(types, f"{file_prefix}.entity"):
+            changed.append(f"{file_prefix}.entity")
 
-        self._create_type_file(["light"], f"{self._file_lights}.entity")
+        return changed
 
-    def _create_intents_from_map_locks(self):
-        file_name = f"{self._file_locks}.intent"
-        os.makedirs(os.path.dirname(file_name), exist_ok=True)
-        with open(file_name, "w", encoding="UTF-8") as sw:
-            sw.write("(please |) {ha_lock_unlock} (the |) {ha_locks}\n")
+    def _create_intents_from_map_lights(self):
+        return self._create_intents([
+            "(please |) turn {ha_on_off} (all |) (the |) {ha_type} (in this |) (room | location | place |)",
+            "(please |) turn {ha_on_off} (all |) (the |) {ha_lights} (in this |) (room | location | place |)",
+            "(please |) turn (all |) (the |) {ha_type} {ha_on_off} (in this |) (room | location | place |)",
+            "(please |) turn (all |) (the |) {ha_lights} {ha_on_off} (in this |) (room | location | place |)",
+            "(please |) turn {ha_on_off} (all |) (the |) {ha_area} {ha_lights}",
+            "(please |) turn (the |) {ha_area} {ha_lights} (all |) {ha_on_off}",
+            "(please |) turn {ha_on_off} (all |) (the |) {ha_lights} (in | on | under | over | at |) (the |) {ha_area}",
+            "(please |) turn (all |) (the |) {ha_lights} (in | on | under | over | at |) (the |) {ha_area} {ha_on_off}",
+            "(please |) turn (all |) (the |) {ha_lights} {ha_on_off} (in | on | under | over | at |) (the |) {ha_area}"
+        ], ["light"], self._file_lights)
 
-        self._create_type_file(["lock"], f"{self._file_locks}.entity")
+    def _create_intents_from_map_locks(self):
+        return self._create_intents([
+            "(please |) {ha_lock_unlock} (the |) {ha_locks}"
+        ], ["lock"], self._file_locks)
 
     def _create_intents_from_map_covers(self):
-        file_name = f"{self._file_covers}.intent"
-        os.makedirs(os.path.dirname(file_name), exist_ok=True)
-        with open(file_name, "w", encoding="UTF-8") as sw:
-            sw.write("(please |) {ha_raise_lower} (the |) {ha_area} {ha_covers}\n")
-            sw.write("(please |) {ha_raise_lower} (the |) {ha_covers} (in | on | under | at) the {ha_area}\n")
-
-        self._create_type_file(["cover"], f"{self._file_covers}.entity")
+        return self._create_intents([
+            "(please |) {ha_raise_lower} (the |) {ha_area} {ha_covers}",
+            "(please |) {ha_raise_lower} (the |) {ha_covers} (in | on | under | at) the {ha_area}"
+        ], ["cover"], self._file_covers)
 
     def handle_homeassistant_intent(self, message, context=None, **kwargs):
         """
@@ -448,22 +990,31 @@ class HomeAssistantSkill(GenericSkill):
             self.say(f"I'm sorry, I couldn't find the {area} {entity}.", context=context)
             return True
 
+        # Send one service call per domain with all matching entities
+        domains = {}
         for entity_id in entity_ids:
             self.logger.debug(f"ENTITY_ID: {entity_id}")
-            type_id = entity_id.split(".", 1)[0] if entity_id is not None and "." in entity_id else type_id
+            domain = entity_id.split(".", 1)[0] if entity_id is not None and "." in entity_id else type_id
+            if entity_id not in domains.setdefault(domain, []):
+                domains[domain].append(entity_id)
 
-            resp = requests.post(f"{self.url}/api/services/{type_id}/turn_{action}", headers=self._headers, timeout=20, json={ "entity_id": entity_id })
-            if resp.ok:
-                self.logger.debug(f"{resp.text}")
+        failed_ids = []
+        for domain in domains:
+            failed_ids.extend(self._call_service(domain, f"turn_{action}", domains.get(domain)))
+
+        if len(failed_ids) > 0:
+            self.logger.error(f"Unable to turn {action} {', '.join(failed_ids)}")
+            names = [self._get_friendly_name(x) for x in failed_ids]
+            if len(names) > 1:
+                names = [", ".join(names[:-1]), names[-1]]
 
-                if not is_all:
-                    if entity.endswith("lights") or entity.endswith("fans") or entity.endswith("lamps"):
-                        self.say(f"{area} {entity} are now {action}.", context=context)
-                    else:
-                        self.say(f"{area} {entity} is now {action}.", context=context)
+            self.say(f"I'm sorry, I was unable to turn {action} the {' and '.join(names)}.", context=context)
+            return True
+        elif not is_all:
+            if entity.endswith("lights") or entity.endswith("fans") or entity.endswith("lamps"):
+                self.say(f"{area} {entity} are now {action}.", context=context)
             else:
-                self.logger.debug(f"{resp.text}")
-                has_error = True
+                self.say(f"{area} {entity} is now {action}.", context=context)
 
         if has_error:
             self.say(f"Something went wrong while I was trying to {error_response}.", context=context)
@@ -479,6 +1030,63 @@ class HomeAssistantSkill(GenericSkill):
 
         return True
 
+    def _call_service(self, domain, service, entity_ids):
+        """
+        Calls a Home Assistant service for a list of entities in a single request.  If Home Assistant
+        rejects the combined request then each entity is retried individually in parallel to find the
+        ones that failed.  If it cannot be reached or does not answer in time then all entities fail.
+
+        Args:
+            domain (str): Service domain (e.g. light)
+            service (str): Service name (e.g. turn_on)
+            entity_ids (list): Entity IDs to pass to the service
+
+        Returns:
+            (list): Entity IDs that could not be updated
+        """
+
+        try:
+            resp = self._session.post(
+                f"{self.url}/api/services/{domain}/{service}",
+                timeout=20,
+                json={"entity_id": entity_ids if len(entity_ids) > 1 else entity_ids[0]}
+            )
+
+            self.logger.debug(f"{resp.text}")
+            if resp.ok:
+                return []
+
+        except requests.RequestException as e:
+            self.logger.debug(f"{str(e)}")
+            return list(entity_ids)
+
+        if len(entity_ids) == 1:
+            return list(entity_ids)
+
+        with ThreadPoolExecutor(max_workers=min(len(entity_ids), 8)) as executor:
+            results = executor.map(lambda x: self._call_service(domain, service, [x]), entity_ids)
+
+        return [x for result in results for x in result]
+
+    def _get_friendly_name(self, entity_id):
+        """
+        Gets the name of an entity for use in spoken responses.
+
+        Args:
+            entity_id (str): Entity ID (e.g. light.office_lamp)
+
+        Returns:
+            (str): Friendly name of the entity or the entity ID if it is not in the intent map
+        """
+
+        with self._map_lock:
+            for names in self._entity_index.values():
+                for record in names.values():
+                    if record.get("entity_id") == entity_id:
+                        return str(record.get("friendly_name") or entity_id)
+
+        return str(entity_id)
+
     def handle_homeassistant_intent_covers(self, message, context=None, **kwargs):
         self.logger.debug("==< COVERS >================================")
         self.logger.debug(f"{message}")
@@ -518,7 +1126,7 @@ class HomeAssistantSkill(GenericSkill):
         error_response = " ".join([x for x in message.sent if x != "please"])
 
         self.logger.debug(f"ENTITY_ID: {entity_id}")
-        resp = requests.post(f"{self.url}/api/services/cover/{daction}_cover", headers=self._headers, timeout=20, json={ "entity_id": entity_id })
+        resp = self._session.post(f"{self.url}/api/services/cover/{daction}_cover", timeout=20, json={ "entity_id": entity_id })
         if resp.ok:
             self.logger.debug(f"{resp.text}")
             if action in ["close", "raise"]:
@@ -550,12 +1158,7 @@ class HomeAssistantSkill(GenericSkill):
             self.say("I'm sorry, I didn't get it.", context=context)
             return True
 
-        entity_id = None
-        for area in self._intent_map.get("lock", {}):
-            item = self._intent_map.get("lock").get(area)
-            if entity in item:
-                entity_id = item.get(entity).get("entity_id")
-                break
+        entity_id = self._entity_index.get("lock", {}).get(entity, {}).get("entity_id")
 
         if entity_id is None:
             self.say(f"I'm sorry, I couldn't find the {entity}.", context=context)
@@ -564,7 +1167,7 @@ class HomeAssistantSkill(GenericSkill):
         error_response = " ".join([x for x in message.sent if x != "please"])
 
         self.logger.debug(f"ENTITY_ID: {entity_id}")
-        resp = requests.post(f"{self.url}/api/services/lock/{action}", headers=self._headers, timeout=20, json={ "entity_id": entity_id })
+        resp = self._session.post(f"{self.url}/api/services/lock/{action}", timeout=20, json={ "entity_id": entity_id })
         if resp.ok:
             self.logger.debug(f"{resp.text}")
             self.say(f"{entity} {action}ed.", context=context)
@@ -573,41 +1176,139 @@ class HomeAssistantSkill(GenericSkill):
 
         return True
 
+    def _index_triggers(self):
+        """
+        Groups the camera triggers by source name and object so each detection only checks its own triggers.
+        """
+
+        trigger_index = {}
+        for trg in self._triggers if isinstance(self._triggers, list) else []:
+            if trg.get("type", "") != "camera":
+                continue
+
+            for item in trg.get("filters", []):
+                trigger_index.setdefault((trg.get("source_name", ""), item), []).append(trg)
+
+        self._trigger_index = trigger_index
+
+    def _get_device_name(self, dev_url):
+        dev_name = self._dev_names.get(dev_url)
+        if dev_name is None:
+            dev_name = self.device.service.remote_devices.get(dev_url, {}).get("name")
+            if dev_name is not None:
+                self._dev_names[dev_url] = dev_name
+
+        return dev_name if dev_name is not None else ""
+
     def _image_timer(self):
-        self._timer_running.set()
+        """
+        Sends trigger changes when they come due.  Sleeps until the next scheduled deadline
+        instead of polling so that it uses no CPU while nothing is changing.
+        """
 
         while self._timer_running.is_set():
-            for dev_url in self._dev_timers:
-                dev_name = self.device.service.remote_devices.get(dev_url, {}).get("name", "")
-                for trg in self._triggers:
-                    if trg.get("type", "") == "camera" and trg.get("source_name", "") == dev_name:
-                        for item in self._dev_timers.get(dev_url):
-                            if item not in trg.get("filters", []):
-                                continue
-
-                            d = self._dev_timers.get(dev_url).get(item)
-                            if d.get("trigger") != d.get("status"):
-                                if d.get("trigger", False) or time.time() > d.get("timestamp") + float(self._timer_delay):
-                                    d["status"] = d.get("trigger")
-
-                                    entity_id = trg.get('entity_id')
-                                    self.logger.debug("==============================================")
-                                    self.logger.debug(f"TRIGGER CHANGE {item}={d.get('status')} : {entity_id}")
-                                    
-                                    domain = entity_id.split(".", 1)[0]
-                                    service = "turn_on" if d.get("status", False) else "turn_off"
-
-                                    resp = requests.post(
-                                        f"{self.url}/api/services/{domain}/{service}", 
-                                        headers=self._headers, 
-                                        timeout=20, 
-                                        json={"entity_id": entity_id}
-                                    )
-
-                                    if resp.ok:
-                                        self.logger.debug(f"{resp.text}")
-
-            time.sleep(0.1)
+            changes = []
+
+            with self._timer_cond:
+                if not self._timer_running.is_set():
+                    break
+
+                if len(self._timer_heap) == 0:
+                    self._timer_cond.wait()
+                else:
+                    timeout = self._timer_heap[0][0] - time.time()
+                    if timeout > 0:
+                        self._timer_cond.wait(timeout)
+
+                now = time.time()
+                while len(self._timer_heap) > 0 and self._timer_heap[0][0] <= now:
+                    _, dev_url, item = heapq.heappop(self._timer_heap)
+
+                    d = self._dev_timers.get(dev_url, {}).get(item)
+                    if d is None or d.get("trigger") == d.get("status"):
+                        continue
+
+                    if d.get("trigger", False) or now >= d.get("timestamp") + float(self._timer_delay):
+                        d["status"] = d.get("trigger")
+                        changes.append((dev_url, item, d.get("status")))
+
+            for dev_url, item, status in changes:
+                for trg in self._trigger_index.get((self._get_device_name(dev_url), item), []):
+                    self._queue_trigger_change(trg, item, status)
+
+    def _queue_trigger_change(self, trg, item, status):
+        """
+        Queues a trigger change for the dispatch workers.  Changes for an entity that is already
+        waiting or being sent are coalesced so only its latest state is sent.
+
+        Args:
+            trg (dict): Trigger configuration
+            item (str): Name of the detected object
+            status (bool): True to turn the entity on and False to turn it off
+        """
+
+        entity_id = trg.get("entity_id")
+
+        with self._dispatch_lock:
+            is_queued = entity_id in self._dispatch_pending or entity_id in self._dispatch_active
+            self._dispatch_pending[entity_id] = (trg, item, status, time.time())
+
+            if is_queued:
+                return
+
+            try:
+                self._dispatch_queue.put_nowait(entity_id)
+            except queue.Full:
+                self._dispatch_pending.pop(entity_id, None)
+                self.logger.error(f"Trigger queue is full.  Dropping change for {entity_id}.")
+
+    def _dispatch_worker(self):
+        while True:
+            entity_id = self._dispatch_queue.get()
+            if entity_id is None:
+                break
+
+            with self._dispatch_lock:
+                change = self._dispatch_pending.pop(entity_id, None)
+                if change is None:
+                    continue
+
+                self._dispatch_active.add(entity_id)
+
+            trg, item, status, queued_at = change
+            self._send_trigger_change(trg, item, status)
+            self.logger.debug(f"TRIGGER DISPATCH {entity_id}={status} in {(time.time() - queued_at) * 1000:.1f}ms")
+
+            with self._dispatch_lock:
+                self._dispatch_active.discard(entity_id)
+
+                if entity_id in self._dispatch_pending:
+                    try:
+                        self._dispatch_queue.put_nowait(entity_id)
+                    except queue.Full:
+                        self._dispatch_pending.pop(entity_id, None)
+                        self.logger.error(f"Trigger queue is full.  Dropping change for {entity_id}.")
+
+    def _send_trigger_change(self, trg, item, status):
+        entity_id = trg.get('entity_id')
+        self.logger.debug("==============================================")
+        self.logger.debug(f"TRIGGER CHANGE {item}={status} : {entity_id}")
+
+        domain = entity_id.split(".", 1)[0]
+        service = "turn_on" if status else "turn_off"
+
+        try:
+            resp = self._session.post(
+                f"{self.url}/api/services/{domain}/{service}", 
+                timeout=20, 
+                json={"entity_id": entity_id}
+            )
+
+            if resp.ok:
+                self.logger.debug(f"{resp.text}")
+
+        except requests.RequestException as e:
+            self.logger.error(f"Unable to update {entity_id}: {str(e)}")
 
     def handle_homeassistant_image_trigger(self, message, context=None, **kwargs):
         
@@ -616,37 +1317,38 @@ class HomeAssistantSkill(GenericSkill):
 
         if isinstance(message, dict):
             dev_url = context.url if context is not None else "unknown"
+            dev_name = self._get_device_name(dev_url)
             dev = {}
 
-            if dev_url not in self._dev_timers:
-                self._dev_timers[dev_url] = {}
-
             for o in message.get("objects", []):
                 o_nm = o.get("name")
 
                 if o_nm is not None:
-                    if o_nm not in self._dev_timers.get(dev_url):
-                        self._dev_timers[dev_url][o_nm] = {
-                            "trigger": True, 
-                            "status": False, 
-                            "timestamp": time.time()
-                        }
-                    else:
-                        self._dev_timers[dev_url][o_nm]["trigger"] = True
-                        self._dev_timers[dev_url][o_nm]["timestamp"] = time.time()
-
-                    if o_nm not in dev:
-                        dev[o_nm] = 1
-                    else:
-                        dev[o_nm] += 1
-
-            for item in self._dev_timers.get(dev_url, {}):
-                if item not in dev:
-                    self._dev_timers[dev_url][item]["trigger"] = False
-                    # self._dev_timers[dev_url][item]["timestamp"] = time.time() + self._timer_delay
+                    dev[o_nm] = dev.get(o_nm, 0) + 1
+
+            now = time.time()
+            with self._timer_cond:
+                timers = self._dev_timers.setdefault(dev_url, {})
+
+                for o_nm in dev:
+                    if (dev_name, o_nm) not in self._trigger_index:
+                        continue
+
+                    d = timers.setdefault(o_nm, {"trigger": False, "status": False, "timestamp": now})
+                    d["timestamp"] = now
+                    if not d["trigger"]:
+                        d["trigger"] = True
+                        heapq.heappush(self._timer_heap, (now, dev_url, o_nm))
+
+                for item in timers:
+                    d = timers.get(item)
+                    if item not in dev and d["trigger"]:
+                        d["trigger"] = False
+                        heapq.heappush(self._timer_heap, (d["timestamp"] + float(self._timer_delay), dev_url, item))
+
+                self._timer_cond.notify()
 
             self.logger.debug(f"HOMEASSISTANTSKILL: {dev}")
-            self.logger.debug(f"HOMEASSISTANTSKILL: {self._dev_timers[dev_url]}")
 
         return True
 
@@ -657,10 +1359,36 @@ class HomeAssistantSkill(GenericSkill):
         Returns:
             (bool):  True on success and False on failure
         """
+        self._live_stop.set()
+        if self._ws is not None:
+            self._ws.close()
+
+        if self._live_thread is not None:
+            self._live_thread.join()
+
         self._timer_running.clear()
+        with self._timer_cond:
+            self._timer_cond.notify()
 
         if self._timer_thread is not None:
             self._timer_thread.join()
+
+        for thread in self._dispatch_threads:
+            self._dispatch_queue.put(None)
+
+        for thread in self._dispatch_threads:
+            thread.join()
+
+        self._dispatch_threads = []
+
+        if self._session is not None:
+            self.logger.debug(f"Connection stats: {self._get_connection_stats()}")
+            self._session.close()
+
+        if self._workspace is not None:
+            shutil.rmtree(self._workspace, ignore_errors=True)
+            self._workspace = None
+
         return True
 
 
@@ -1,12 +1,120 @@
+import os
+import json
+import tempfile
 import threading
 import time
+import random
+import re
+import bisect
+import hashlib
 import logging
 import requests
+from concurrent.futures import ThreadPoolExecutor
 import xml.etree.ElementTree as ET
-from email.utils import parsedate_tz
+from email.utils import parsedate_tz, mktime_tz
 import datetime
 from kenzy import GenericSkill
 
+CACHE_VERSION = 1
+
+
+class HeadlineStore(object):
+    """
+    Sorted, de-duplicated collection of the most recent headlines
+    """
+
+    def __init__(self, max_size=100, max_age=86400):
+        """
+        Headline Store Initialization
+
+        Args:
+            max_size (int): Maximum number of headlines to keep
+            max_age (float): Headlines older than this many seconds are removed
+        """
+
+        self.max_size = max_size
+        self.max_age = max_age
+
+        # Readers only ever see a complete list that is replaced on each merge
+        self.entries = []
+
+        self._lock = threading.Lock()
+        self._sort_keys = []
+        self._entries = []
+        self._keys = {}
+        self._counter = 0
+
+    def get_keys(self, entry):
+        """
+        Gets the keys used to recognize a headline that has already been stored.  The same story
+        syndicated on multiple feeds usually has a different link but the same title.
+
+        Args:
+            entry (dict): Headline entry
+
+        Returns:
+            (list): Keys for the entry
+        """
+
+        keys = []
+        for field in ["guid", "url"]:
+            if entry.get(field) is not None:
+                keys.append(f"{field}:{entry.get(field)}")
+
+        title = " ".join(re.sub(r"[^\w\s]", "", str(entry.get("title", "")).lower()).split())
+        keys.append("title:" + hashlib.sha1(title.encode("UTF-8")).hexdigest())
+        return keys
+
+    def merge(self, entries):
+        """
+        Adds new headlines and removes the oldest ones that are over the size or age limits.
+
+        Args:
+            entries (list): Headline entries to add
+
+        Returns:
+            (int): Number of headlines added
+        """
+
+        added = 0
+        with self._lock:
+            now = time.time()
+            cutoff = now - self.max_age
+
+            for entry in entries:
+                # Dates are optional in RSS so undated headlines are aged from when they were first seen
+                if not entry.get("timestamp"):
+                    entry = dict(entry, timestamp=now)
+
+                if entry.get("timestamp") < cutoff:
+                    continue
+
+                keys = self.get_keys(entry)
+                if any(x in self._keys for x in keys):
+                    continue
+
+                self._counter += 1
+                sort_key = (-entry.get("timestamp"), self._counter)
+                idx = bisect.bisect(self._sort_keys, sort_key)
+                self._sort_keys.insert(idx, sort_key)
+                self._entries.insert(idx, (entry, keys))
+                for key in keys:
+                    self._keys[key] = entry
+
+                added += 1
+
+            while len(self._entries) > 0 \
+                    and (len(self._entries) > self.max_size or -self._sort_keys[-1][0] < cutoff):
+
+                self._sort_keys.pop()
+                _, keys = self._entries.pop()
+                for key in keys:
+                    self._keys.pop(key, None)
+
+            self.entries = [x[0] for x in self._entries]
+
+        return added
+
 
 class NewsSkill(GenericSkill):
     """
@@ -24,11 +132,22 @@ class NewsSkill(GenericSkill):
         self.description = "RSS feed reader"
         self._version = [1, 0, 0]
 
-        self._is_running = threading.Event()
+        self._stop_event = threading.Event()
         self.thread = None
 
         self.feeds = []
         self.news = []
+        self.entries = []
+        self.timeout = 10
+        self.items_per_feed = 7
+        self.interval = 900
+        self.max_workers = 0
+
+        self._feed_state = {}
+        self._feed_intervals = {}
+        self._store = HeadlineStore()
+        self._read_entries = []
+        self._file_cache = None
 
         self.logger.debug(f"{self.name} loaded successfully.")
     
@@ -40,11 +159,35 @@ class NewsSkill(GenericSkill):
             (bool): True on success else raises an exception
         """
 
-        self.feeds = self.get_setting("feeds", ["https://feeds.a.dj.com/rss/RSSWorldNews.xml"])
+        self.timeout = float(self.get_setting("timeout", 10))
+        self.items_per_feed = int(self.get_setting("items_per_feed", 7))
+        self.interval = float(self.get_setting("interval", 900))
+        self.max_workers = int(self.get_setting("max_workers", 0))
+
+        self._store = HeadlineStore(
+            max_size=int(self.get_setting("max_headlines", 100)),
+            max_age=float(self.get_setting("max_age", 86400))
+        )
 
-        self.get_news()
+        self.feeds = []
+        self._feed_intervals = {}
+        for feed in self.get_setting("feeds", ["https://feeds.a.dj.com/rss/RSSWorldNews.xml"]):
+            if isinstance(feed, dict):
+                self.feeds.append(feed.get("url"))
+                self._feed_intervals[feed.get("url")] = float(feed.get("interval", self.interval))
+            else:
+                self.feeds.append(feed)
+                self._feed_intervals[feed] = self.interval
 
-        self._is_running.set()
+        config = json.dumps(self.feeds, sort_keys=True)
+        key = hashlib.sha256(config.encode("UTF-8")).hexdigest()[:12]
+        self._file_cache = None
+        if str(self.get_setting("cache", "enable")).lower().strip() == "enable":
+            self._file_cache = os.path.join(tempfile.gettempdir(), f"news_cache_{key}.json")
+            self.load_cache()
+
+        # The first download happens in the reader thread so startup does not wait on the feeds
+        self._stop_event.clear()
         self.thread = threading.Thread(target=self.start_reader, daemon=True)
         self.thread.start()
         
@@ -52,61 +195,262 @@ class NewsSkill(GenericSkill):
         
         return True
     
-    def get_news(self):
+    def get_news(self, feeds=None):
+        """
+        Downloads feeds in parallel and updates the list of headlines.
+
+        Args:
+            feeds (list): Feeds to download.  Downloads all feeds if None. (optional)
+        """
+
+        feeds = self.feeds if feeds is None else feeds
+        if len(feeds) == 0:
+            return
+
+        try:
+            # One download per feed at a time so a refresh takes as long as the slowest feed unless limited
+            workers = len(feeds) if self.max_workers <= 0 else min(len(feeds), self.max_workers)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(self.get_feed, feeds))
+
+            added = self._store.merge([x for result in results for x in result])
+            self.entries = self._store.entries
+            self.logger.debug(f"Added {added} headlines.")
+
+            self.save_cache()
+
+        except Exception as e:
+            self.logger.error(f"Unable to update news: {str(e)}")
+
+    def load_cache(self):
+        """
+        Loads the headlines saved by a previous run.
+
+        Returns:
+            (bool): True on success else False
+        """
+
+        if self._file_cache is None or not os.path.isfile(self._file_cache):
+            return False
+
         try:
-            entries = []
-            for feed in self.feeds:
-                resp = requests.get(feed)
+            with open(self._file_cache, "r", encoding="UTF-8") as fp:
+                cache = json.load(fp)
+
+            if cache.get("version") != CACHE_VERSION:
+                return False
+
+            self._feed_state = cache.get("feeds", {})
+            self._store.merge(cache.get("entries", []))
+            self.entries = self._store.entries
+
+        except Exception as e:
+            self.logger.error(f"Unable to load news cache: {str(e)}")
+            return False
+
+        self.logger.debug(f"Loaded {len(self.entries)} headlines from cache.")
+        return True
+
+    def save_cache(self):
+        """
+        Saves the current headlines so they are available immediately on the next start.
+
+        Returns:
+            (bool): True on success else False
+        """
+
+        if self._file_cache is None:
+            return False
+
+        try:
+            tmp_file = f"{self._file_cache}.tmp"
+            with open(tmp_file, "w", encoding="UTF-8") as sw:
+                json.dump({
+                    "version": CACHE_VERSION,
+                    "feeds": self._feed_state,
+                    "entries": self.entries
+                }, sw)
+
+            os.replace(tmp_file, self._file_cache)
+
+        except Exception as e:
+            self.logger.error(f"Unable to save news cache: {str(e)}")
+            return False
+
+        return True
+
+    def get_feed(self, feed):
+        """
+        Downloads a single feed.  The ETag and Last-Modified headers from the previous download are sent
+        so that an unchanged feed returns 304 and is not parsed again.
+
+        Args:
+            feed (str): URL of the RSS feed
+
+        Returns:
+            (list): Entries from the feed or an empty list if it was unchanged or could not be downloaded
+        """
+
+        state = self._feed_state.get(feed, {})
+
+        headers = {}
+        if state.get("etag") is not None:
+            headers["If-None-Match"] = state.get("etag")
+        if state.get("modified") is not None:
+            headers["If-Modified-Since"] = state.get("modified")
+
+        try:
+            with requests.get(feed, headers=headers, timeout=self.timeout, stream=True) as resp:
+                if resp.status_code == 304:
+                    self.logger.debug(f"Feed not modified: {feed}")
+                    state["failures"] = 0
+                    return []
+
                 if resp.ok:
-                    root = ET.fromstring(resp.content)
-                    post_items = root.findall(".//item")
-                    for item in range(0, len(post_items)):
-                        post_item = root.findall(".//item")[item]
+                    resp.raw.decode_content = True
+                    entries = self.parse_feed(resp.raw)
+                    self._feed_state[feed] = {
+                        "etag": resp.headers.get("ETag"),
+                        "modified": resp.headers.get("Last-Modified"),
+                        "failures": 0
+                    }
+
+                    return entries
 
-                        post_title = post_item.find("title").text
-                        post_date = post_item.find("pubDate").text
-                        post_link = post_item.find("link").text
-                        post_description = post_item.find("description").text
-                        struct_time = parsedate_tz(post_date)
-                        timestamp = datetime.datetime(*struct_time[:6]).timestamp()
+                self.logger.error(f"Unable to download feed {feed}: {resp.status_code}")
 
-                        post = { "title": post_title, "timestamp": timestamp, "url": post_link, "description": post_description }
+        except Exception as e:
+            self.logger.error(f"Unable to download feed {feed}: {str(e)}")
 
-                        entries.append(post)
+        state["failures"] = state.get("failures", 0) + 1
+        self._feed_state[feed] = state
+        return []
 
-                        if item > 5:
-                            break
+    def parse_feed(self, source):
+        """
+        Reads the first entries of an RSS or Atom feed.  The feed is parsed as a stream and each
+        entry is discarded once it is read so that large feeds do not need to be held in memory.
 
-            sorted_entries = sorted(entries, key=lambda x: x.get("timestamp"), reverse=True)
-            self.entries = sorted_entries
+        Args:
+            source (obj): File name or file object containing the feed
+
+        Returns:
+            (list): Entries from the feed
+        """
+
+        entries = []
+        parents = []
+
+        for event, elem in ET.iterparse(source, events=("start", "end")):
+            if event == "start":
+                parents.append(elem)
+                continue
+
+            parents.pop()
+            tag = elem.tag.rsplit("}", 1)[-1]
+            if tag not in ["item", "entry"]:
+                continue
+
+            post = self.parse_entry(elem)
+            if len(parents) > 0:
+                parents[-1].remove(elem)
+
+            if post is not None:
+                entries.append(post)
+
+            if len(entries) >= self.items_per_feed:
+                break
+
+        return entries
+
+    def parse_entry(self, elem):
+        fields = {}
+        for child in elem:
+            name = child.tag.rsplit("}", 1)[-1]
+            if name == "link" and child.get("href") is not None:
+                if child.get("rel", "alternate") == "alternate":
+                    fields["link"] = child.get("href")
+            elif name not in fields:
+                fields[name] = child.text
+
+        post_title = fields.get("title")
+        if post_title is None:
+            return None
+
+        timestamp = 0
+        post_date = fields.get("pubDate")
+        if post_date is not None:
+            struct_time = parsedate_tz(post_date)
+            if struct_time is not None:
+                timestamp = mktime_tz(struct_time)
+        else:
+            post_date = fields.get("published", fields.get("updated", fields.get("date")))
+            if post_date is not None:
+                try:
+                    timestamp = datetime.datetime.fromisoformat(post_date.strip().replace("Z", "+00:00")).timestamp()
+                except ValueError:
+                    pass
+
+        post_link = fields.get("link")
+        post_description = fields.get("description", fields.get("summary", fields.get("content")))
+
+        return {
+            "title": post_title.strip(), 
+            "timestamp": timestamp, 
+            "url": post_link, 
+            "description": post_description,
+            "guid": fields.get("guid", fields.get("id", post_link))
+        }
+
+    def get_next_refresh(self, feed):
+        """
+        Calculates when a feed should be downloaded next.  Failing feeds are retried less often
+        and a random offset spreads the feeds out so they are not all downloaded at once.
+
+        Args:
+            feed (str): URL of the RSS feed
+
+        Returns:
+            (float): Time of the next download
+        """
+
+        interval = self._feed_intervals.get(feed, self.interval)
+        failures = self._feed_state.get(feed, {}).get("failures", 0)
+        delay = interval * (2 ** min(failures, 4))
+        return time.time() + delay + random.uniform(0, interval * 0.1)
 
-        except:
-            pass
-    
     def start_reader(self):
+        next_refresh = {feed: 0 for feed in self.feeds}
 
-        i = 0
-        while self._is_running.is_set():
-            i = i + 1
-            if i % 9000 == 0:
-                # Check for new news once every 15 minutes (900 seconds).
-                self.get_news()
+        while not self._stop_event.is_set():
+            now = time.time()
+            due = [feed for feed in self.feeds if next_refresh.get(feed, 0) <= now]
 
-            time.sleep(0.1)
+            if len(due) > 0:
+                self.get_news(due)
+                for feed in due:
+                    next_refresh[feed] = self.get_next_refresh(feed)
+
+            if len(next_refresh) == 0:
+                self._stop_event.wait()
+            else:
+                self._stop_event.wait(max(min(next_refresh.values()) - time.time(), 0))
 
     def handle_latestnews_continue(self, message, context=None, **kwargs):
         if str(message).lower().strip().strip("?.!") in ["yes", "please", "continue", "okay", "ok"]:
 
-            if len(self.entries) > 2:
-                entry3 = self.entries[2].get("title")
+            entries = self._read_entries
+
+            if len(entries) > 2:
+                entry3 = entries[2].get("title")
                 self.say(entry3, context=context)
 
-            if len(self.entries) > 4:
-                entry3 = self.entries[3].get("title")
+            if len(entries) > 4:
+                entry3 = entries[3].get("title")
                 self.say(entry3, context=context)
 
-            if len(self.entries) > 5:
-                entry3 = self.entries[4].get("title")
+            if len(entries) > 5:
+                entry3 = entries[4].get("title")
                 self.say(entry3, context=context)
 
     def handle_latestnews_intent(self, message, context=None, **kwargs):
@@ -121,16 +465,19 @@ class NewsSkill(GenericSkill):
             (bool): True on success or False on failure
         """
         
-        if len(self.entries) >= 2:
+        entries = self.entries
+        self._read_entries = entries
+
+        if len(entries) >= 2:
             self.say("The latest two headlines are", context=context)
 
-            entry1 = self.entries[0].get("title")
-            entry2 = self.entries[1].get("title")
+            entry1 = entries[0].get("title")
+            entry2 = entries[1].get("title")
 
             self.say(entry1, context=context)
             self.say(entry2, context=context)
         
-            if len(self.entries) > 2:
+            if len(entries) > 2:
                 return self.ask("Would you like to continue?", self.handle_latestnews_continue, context=context)
             else:
                 return True
@@ -145,7 +492,7 @@ class NewsSkill(GenericSkill):
             (bool):  True on success and False on failure
         """
         
-        self._is_running.clear()
+        self._stop_event.set()
         return True
         
     
@@ -1,9 +1,173 @@
 import os
-import yaml
-import copy
+import json
+import math
+import time
+import threading
+from array import array
 from kenzy import GenericSkill
 
 
+def load_lookup(file_name):
+    """
+    Loads a lookup table compiled to JSON by build.py.  Falls back to parsing the YAML source
+    if the compiled file is not available.
+
+    Args:
+        file_name (str): Path of the table without the file extension
+
+    Returns:
+        (dict): Lookup table with string keys
+    """
+
+    if os.path.isfile(f"{file_name}.json"):
+        with open(f"{file_name}.json", "r", encoding="UTF-8") as fp:
+            return json.load(fp)
+
+    import yaml
+    with open(f"{file_name}.yml", "r", encoding="UTF-8") as fp:
+        return {str(k): v for k, v in yaml.safe_load(fp).items()}
+
+
+IRREGULAR_PLURALS = {
+    "person": "people", "man": "men", "woman": "women", "child": "children", "mouse": "mice",
+    "goose": "geese", "foot": "feet", "tooth": "teeth", "sheep": "sheep", "deer": "deer", "fish": "fish",
+    "knife": "knives", "wife": "wives", "life": "lives", "tie": "ties", "pie": "pies", "cookie": "cookies"
+}
+IRREGULAR_SINGULARS = {v: k for k, v in IRREGULAR_PLURALS.items()}
+
+
+def make_plural(name):
+    """
+    Makes the plural form of a name using common English rules.  Only the last word of the name is changed.
+
+    Args:
+        name (str): Singular name (e.g. wine glass)
+
+    Returns:
+        (str): Plural name (e.g. wine glasses)
+    """
+
+    prefix, _, word = name.rpartition(" ")
+    prefix = f"{prefix} " if prefix != "" else ""
+
+    if word in IRREGULAR_PLURALS:
+        word = IRREGULAR_PLURALS.get(word)
+    elif word.endswith(("s", "x", "z", "ch", "sh")):
+        word = f"{word}es"
+    elif len(word) > 1 and word.endswith("y") and word[-2] not in "aeiou":
+        word = f"{word[:-1]}ies"
+    else:
+        word = f"{word}s"
+
+    return f"{prefix}{word}"
+
+
+def make_singular(name):
+    """
+    Makes the singular form of a name by reversing the rules of make_plural.  Only the last word of the name is changed.
+
+    Args:
+        name (str): Plural name (e.g. wine glasses)
+
+    Returns:
+        (str): Singular name (e.g. wine glass)
+    """
+
+    prefix, _, word = name.rpartition(" ")
+    prefix = f"{prefix} " if prefix != "" else ""
+
+    if word in IRREGULAR_SINGULARS:
+        word = IRREGULAR_SINGULARS.get(word)
+    elif len(word) > 4 and word.endswith("ies") and word[-4] not in "aeiou":
+        word = f"{word[:-3]}y"
+    elif word.endswith(("sses", "xes", "zes", "ches", "shes")):
+        word = word[:-2]
+    elif word.endswith("s") and not word.endswith("ss"):
+        word = word[:-1]
+
+    return f"{prefix}{word}"
+
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9,
+    "ten": 10, "fifteen": 15, "twenty": 20, "thirty": 30, "forty": 40, "forty five": 45, "fifty": 50, "sixty": 60
+}
+
+
+class DetectionHistory(object):
+    """
+    Fixed size history of the objects seen by one camera
+    """
+
+    def __init__(self, bucket_seconds=60, num_buckets=60):
+        """
+        Detection History Initialization
+
+        Args:
+            bucket_seconds (float): Length of each time bucket in seconds
+            num_buckets (int): Number of buckets to keep
+        """
+
+        self.bucket_seconds = bucket_seconds
+        self.num_buckets = num_buckets
+
+        # Highest number of each object seen at once during each bucket.  Buckets are reused in a ring.
+        self._counts = {}
+        self._bucket_ids = array("q", [-1] * num_buckets)
+
+    def record(self, counts, timestamp):
+        """
+        Records the objects seen at a point in time.
+
+        Args:
+            counts (dict): Number of each object seen
+            timestamp (float): Time the objects were seen
+        """
+
+        bucket_id = int(timestamp // self.bucket_seconds)
+        idx = bucket_id % self.num_buckets
+
+        if self._bucket_ids[idx] != bucket_id:
+            self._bucket_ids[idx] = bucket_id
+            for name in self._counts:
+                self._counts[name][idx] = 0
+
+        for name in counts:
+            if name not in self._counts:
+                self._counts[name] = array("H", [0] * self.num_buckets)
+
+            self._counts[name][idx] = max(self._counts[name][idx], min(counts.get(name), 65535))
+
+    def query(self, seconds, timestamp):
+        """
+        Gets the highest number of each object seen at once during a time window.
+
+        Args:
+            seconds (float): Length of the window ending at timestamp
+            timestamp (float): End of the window
+
+        Returns:
+            (dict): Highest count of each object seen during the window
+        """
+
+        bucket_id = int(timestamp // self.bucket_seconds)
+        num_buckets = min(max(int(math.ceil(seconds / self.bucket_seconds)), 1), self.num_buckets)
+
+        indexes = []
+        for i in range(bucket_id - num_buckets + 1, bucket_id + 1):
+            if self._bucket_ids[i % self.num_buckets] == i:
+                indexes.append(i % self.num_buckets)
+
+        result = {}
+        for name in self._counts:
+            arr = self._counts[name]
+            count = max([arr[idx] for idx in indexes], default=0)
+            if count > 0:
+                result[name] = count
+
+        return result
+
+
 class WatcherSkill(GenericSkill):
     """
     Skill to leverage kenzy.image devices
@@ -16,13 +180,24 @@ class WatcherSkill(GenericSkill):
         
         super().__init__(**kwargs)
 
-        self.plurals = {}
+        self.plurals = None
+        self._plural_cache = {}
+        self._singulars = None
         self.name = "WatcherSkill"
         self.description = "Query kenzy.image devices"
         self._version = [1, 1, 0]
         
         self.filters = None
 
+        self._lock = threading.Lock()
+        self._camera_counts = {}
+        self._object_counts = {}
+        self._motion = {}
+        self._locations = {}
+        self._history = {}
+        self._history_bucket_seconds = 60
+        self._history_buckets = 60
+
         self.logger.debug(f"{self.name} loaded successfully.")
     
     def initialize(self):
@@ -35,14 +210,83 @@ class WatcherSkill(GenericSkill):
 
         self.filters = self.get_setting("filters")
         if isinstance(self.filters, list):
-            self.filters = [str(x).lower() for x in self.filters]
+            self.filters = frozenset([str(x).lower() for x in self.filters])
+        else:
+            self.filters = None
+
+        self._history_bucket_seconds = float(self.get_setting("history_bucket_seconds", 60))
+        self._history_buckets = int(self.get_setting("history_buckets", 60))
 
-        with open(os.path.join(os.path.dirname(__file__), "plurals.yml"), "r", encoding="UTF-8") as fp:
-            self.plurals = yaml.safe_load(fp)
+        data = self.device.data.get("kenzy.image") if self.device is not None else None
+        for dev_url in list(data or {}):
+            self.update_camera(dev_url, data.get(dev_url))
 
+        self.register_type_trigger("kenzy.image", self.handle_watcher_image_trigger)
         self.register_intent_file("watcher.intent", self.handle_watcher_general_intent)
+        self.register_intent_file("watcher_location.intent", self.handle_watcher_location_intent)
+        self.register_intent_file("watcher_count.intent", self.handle_watcher_count_intent)
         return True
         
+    def get_plurals(self):
+        """
+        Gets the plural forms of object names, loading them on first use.
+
+        Returns:
+            (dict): Plural forms keyed by object name
+        """
+
+        if self.plurals is None:
+            self.plurals = load_lookup(os.path.join(os.path.dirname(__file__), "plurals"))
+
+        return self.plurals
+
+    def update_camera(self, dev_url, data):
+        """
+        Updates the running object counts and motion areas with the latest data from one camera.
+
+        Args:
+            dev_url (str): URL of the kenzy.image device
+            data (dict): Latest objects and motion reported by the device
+        """
+
+        counts = {}
+        for o in data.get("objects", []):
+            name = o.get("name")
+            if self.filters is None or str(name).lower() in self.filters:
+                counts[name] = counts.get(name, 0) + 1
+
+        location = self.device.service.remote_devices.get(dev_url, {}).get("location")
+
+        with self._lock:
+            old_counts = self._camera_counts.get(dev_url, {})
+            self._camera_counts[dev_url] = counts
+
+            if location is not None:
+                self._locations[dev_url] = str(location).lower().strip()
+
+            if dev_url not in self._history:
+                self._history[dev_url] = DetectionHistory(self._history_bucket_seconds, self._history_buckets)
+
+            self._history[dev_url].record(counts, time.time())
+
+            for name in set(old_counts) | set(counts):
+                total = self._object_counts.get(name, 0) - old_counts.get(name, 0) + counts.get(name, 0)
+                if total > 0:
+                    self._object_counts[name] = total
+                else:
+                    self._object_counts.pop(name, None)
+
+            if location is not None and data.get("motion", False):
+                self._motion[dev_url] = location
+            else:
+                self._motion.pop(dev_url, None)
+
+    def handle_watcher_image_trigger(self, message, context=None, **kwargs):
+        if isinstance(message, dict):
+            self.update_camera(context.url if context is not None else "unknown", message)
+
+        return True
+
     def handle_watcher_general_intent(self, message, context=None, **kwargs):
         """
         Primary function for intent matches.  Called by skill manager.
@@ -55,33 +299,12 @@ class WatcherSkill(GenericSkill):
             (bool): True on success or False on failure
         """
 
-        data = copy.deepcopy(self.device.data.get("kenzy.image"))
-
-        motion = []
-        objects = {}
-        for dev_url in data:
-            d = data.get(dev_url)
-            for o in d.get("objects", []):
-                if not isinstance(self.filters, list) or str(o.get("name")).lower() in self.filters:
-                    objects[o.get("name")] = objects.get(o.get("name"), 0) + 1
-
-            if dev_url in self.device.service.remote_devices:
-                location = self.device.service.remote_devices.get(dev_url).get("location")
-
-            if location is not None:
-                if d.get("motion", False):
-                    motion.append(location)
+        with self._lock:
+            objects = dict(self._object_counts)
+            motion = set(self._motion.values())
 
         if len(objects) > 0:
-            text_arr = []
-            for x in objects:
-                t = x if objects.get(x) == 1 else self.plurals.get(x, f"{x}s")
-                text_arr.append(str(f"{objects.get(x)} {t}"))
-
-            if len(text_arr) > 1:
-                text_arr[-1] = f"and {text_arr[-1]}"
-
-            text = ", ".join(text_arr)
+            text = self.describe_objects(objects)
 
             text2 = ""
             if len(motion) > 0:
@@ -95,6 +318,179 @@ class WatcherSkill(GenericSkill):
         
         return self.say("I don't see anything at the moment.", context=context)
 
+    def describe_objects(self, objects):
+        """
+        Builds a spoken list of object counts (e.g. "2 people, and 1 dog").
+
+        Args:
+            objects (dict): Number of each object
+
+        Returns:
+            (str): Spoken list of the objects
+        """
+
+        text_arr = []
+        for x in objects:
+            t = x if objects.get(x) == 1 else self.get_plural(x)
+            text_arr.append(str(f"{objects.get(x)} {t}"))
+
+        if len(text_arr) > 1:
+            text_arr[-1] = f"and {text_arr[-1]}"
+
+        return ", ".join(text_arr)
+
+    def get_location_counts(self, location, seconds=None):
+        """
+        Gets the objects seen by the cameras in a location, either right now or during a time window.
+
+        Args:
+            location (str): Location of the cameras
+            seconds (float): Length of the time window.  Uses the latest detections if None. (optional)
+
+        Returns:
+            (dict): Number of each object seen in the location or None if there are no cameras in the location
+        """
+
+        location = str(location).lower().strip()
+        now = time.time()
+
+        with self._lock:
+            dev_urls = [x for x in self._locations if self._locations.get(x) == location]
+            if len(dev_urls) == 0:
+                return None
+
+            objects = {}
+            for dev_url in dev_urls:
+                if seconds is None:
+                    counts = self._camera_counts.get(dev_url, {})
+                else:
+                    counts = self._history.get(dev_url).query(seconds, now)
+
+                for name in counts:
+                    objects[name] = objects.get(name, 0) + counts.get(name)
+
+        return objects
+
+    def get_plural(self, name):
+        """
+        Gets the plural form of an object name.  Names in plurals.yml are used as is and all
+        other names follow the usual English rules.  Results are cached per name.
+
+        Args:
+            name (str): Object name (e.g. wine glass)
+
+        Returns:
+            (str): Plural form of the name (e.g. wine glasses)
+        """
+
+        plural = self._plural_cache.get(name)
+        if plural is None:
+            plural = self.get_plurals().get(name)
+            if plural is None:
+                plural = make_plural(str(name))
+
+            self._plural_cache[name] = plural
+
+        return plural
+
+    def get_singular(self, name):
+        """
+        Gets the object name for a plural form spoken by the user.
+
+        Args:
+            name (str): Plural or singular form of the name
+
+        Returns:
+            (str): Singular form of the name
+        """
+
+        name = str(name).lower().strip()
+
+        if self._singulars is None:
+            self._singulars = {plural: singular for singular, plural in self.get_plurals().items()}
+
+        if name in self._singulars:
+            return self._singulars.get(name)
+
+        return make_singular(name)
+
+    def handle_watcher_location_intent(self, message, context=None, **kwargs):
+        """
+        Primary function for intent matches.  Called by skill manager.
+
+        Args:
+            message (obj):  text that triggered the intent
+            context (KContext): Context surrounding the request. (optional)
+
+        Returns:
+            (bool): True on success or False on failure
+        """
+
+        location = message.matches.get("watcher_location", context.location if context is not None else "")
+        location = str(location).replace(".", "").lower().strip()
+        minutes = message.matches.get("watcher_minutes")
+
+        seconds = None
+        if minutes is not None:
+            minutes = str(minutes).replace(".", "").lower().strip()
+            minutes = NUMBER_WORDS.get(minutes, minutes)
+            try:
+                seconds = float(minutes) * 60
+            except ValueError:
+                return self.say("I'm sorry, I didn't get it.", context=context)
+        elif "did" in message.sent or "have" in message.sent:
+            seconds = 600
+            minutes = 10
+
+        objects = self.get_location_counts(location, seconds)
+        if objects is None:
+            return self.say(f"I don't have a camera in the {location}.", context=context)
+
+        if seconds is None:
+            if len(objects) > 0:
+                return self.say(f"I see {self.describe_objects(objects)} in the {location}.", context=context)
+
+            return self.say(f"I don't see anything in the {location} at the moment.", context=context)
+
+        if len(objects) > 0:
+            return self.say(f"I saw {self.describe_objects(objects)} in the {location} in the last {minutes} minutes.", context=context)
+
+        return self.say(f"I didn't see anything in the {location} in the last {minutes} minutes.", context=context)
+
+    def handle_watcher_count_intent(self, message, context=None, **kwargs):
+        """
+        Primary function for intent matches.  Called by skill manager.
+
+        Args:
+            message (obj):  text that triggered the intent
+            context (KContext): Context surrounding the request. (optional)
+
+        Returns:
+            (bool): True on success or False on failure
+        """
+
+        name = self.get_singular(str(message.matches.get("watcher_object", "")).replace(".", ""))
+        location = message.matches.get("watcher_location")
+
+        if location is None:
+            with self._lock:
+                objects = dict(self._object_counts)
+
+            location_text = ""
+        else:
+            location = str(location).replace(".", "").lower().strip()
+            objects = self.get_location_counts(location)
+            if objects is None:
+                return self.say(f"I don't have a camera in the {location}.", context=context)
+
+            location_text = f" in the {location}"
+
+        count = objects.get(name, 0)
+        if count == 0:
+            return self.say(f"I don't see any {self.get_plural(name)}{location_text} right now.", context=context)
+
+        return self.say(f"I see {self.describe_objects({name: count})}{location_text} right now.", context=context)
+
     def stop(self):
         """
         Method to stop any daemons created during startup/initialization for this skill.
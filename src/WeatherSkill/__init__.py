@@ -1,8 +1,69 @@
 import os
-import yaml
+import time
+import bisect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import json
 import requests
 from kenzy import GenericSkill
 
+# Highest degree (inclusive) for each compass point.  Anything above the last bound is north again.
+COMPASS_BOUNDS = [15, 35, 55, 75, 105, 125, 145, 165, 195, 215, 235, 255, 285, 305, 325, 345]
+COMPASS_POINTS = [
+    "north", "north/northeast", "northeast", "east/northeast",
+    "east", "east/southeast", "southeast", "south/southeast",
+    "south", "south/southwest", "southwest", "west/southwest",
+    "west", "west/northwest", "northwest", "north/northwest",
+    "north"
+]
+
+# Spoken weather summary.  Each optional clause is rendered separately and left empty when it does not apply.
+WEATHER_TEMPLATE = "The temperature is {temperature} degrees{conditions}{wind}{direction}{gust}."
+WEATHER_CLAUSES = {
+    "conditions": " with {conditions}",
+    "wind": ". The wind is blowing at about {speed} {units}",
+    "direction": " from the {direction}",
+    "gust": " with gusts up to {gust} {units}"
+}
+
+
+def get_compass_direction(deg):
+    """
+    Converts a wind direction in degrees to a compass point.
+
+    Args:
+        deg (float): Wind direction in degrees
+
+    Returns:
+        (str): Compass point or None if the direction is missing or invalid
+    """
+
+    if not isinstance(deg, (int, float)) or deg < 0:
+        return None
+
+    return COMPASS_POINTS[bisect.bisect_left(COMPASS_BOUNDS, deg % 360)]
+
+
+def load_lookup(file_name):
+    """
+    Loads a lookup table compiled to JSON by build.py.  Falls back to parsing the YAML source
+    if the compiled file is not available.
+
+    Args:
+        file_name (str): Path of the table without the file extension
+
+    Returns:
+        (dict): Lookup table with string keys
+    """
+
+    if os.path.isfile(f"{file_name}.json"):
+        with open(f"{file_name}.json", "r", encoding="UTF-8") as fp:
+            return json.load(fp)
+
+    import yaml
+    with open(f"{file_name}.yml", "r", encoding="UTF-8") as fp:
+        return {str(k): v for k, v in yaml.safe_load(fp).items()}
+
 
 class WeatherSkill(GenericSkill):
     """
@@ -25,6 +86,24 @@ class WeatherSkill(GenericSkill):
         self.longitude = None
         self.units = "imperial"
         self.condition_map = None
+        self.api_url = "https://api.openweathermap.org/data/2.5"
+        self.timeout = 10
+        self.cache_ttl = 300
+        self.cache_max_stale = 3600
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        self.locations = {}
+        self.forecasts = {}
+        self.prefetch_interval = 300
+        self.prefetch_forecast = False
+
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._inflight = {}
+        self._stop_event = threading.Event()
+        self.thread = None
 
         self.logger.debug(f"{self.name} loaded successfully.")
 
@@ -44,29 +123,284 @@ class WeatherSkill(GenericSkill):
         if self.units is None:
             self.units = "imperial"
 
+        self.api_url = str(self.get_setting("api_url", "https://api.openweathermap.org/data/2.5")).rstrip("/")
+        self.timeout = float(self.get_setting("timeout", 10))
+        self.cache_ttl = float(self.get_setting("cache_ttl", 300))
+        self.cache_max_stale = float(self.get_setting("cache_max_stale", 3600))
+
+        self.locations = {}
+        locations = self.get_setting("locations", {})
+        for name in locations if isinstance(locations, dict) else {}:
+            coords = locations.get(name) or {}
+            if coords.get("lat") is not None and coords.get("lon") is not None:
+                self.locations[str(name).lower().strip()] = (coords.get("lat"), coords.get("lon"))
+
         if self.api_key is None \
-                or self.lattitude is None \
-                or self.longitude is None:
+                or (self.lattitude is None or self.longitude is None) and len(self.locations) == 0:
             
             self.logger.error("Unable to initialize weather skill.  Missing configuration.")
             return False
         
-        with open(os.path.join(os.path.dirname(__file__), "weather_conditions.yml"), "r", encoding="UTF-8") as fp:
-            self.condition_map = yaml.safe_load(fp)
+        if str(self.get_setting("prefetch", "disable")).lower().strip() == "enable":
+            self.prefetch_interval = float(self.get_setting("prefetch_interval", 300))
+            self.prefetch_forecast = str(self.get_setting("prefetch_forecast", "disable")).lower().strip() == "enable"
+
+            self._stop_event.clear()
+            self.thread = threading.Thread(target=self.start_prefetch, daemon=True)
+            self.thread.start()
 
         self.register_intent_file("weather.intent", self.handle_weather_intent)
         self.register_intent_file("temperature.intent", self.handle_temperature_intent)
         return True
 
-    def get_data(self):
-        resp = requests.get(f"https://api.openweathermap.org/data/2.5/weather?lat={self.lattitude}&lon={self.longitude}&appid={self.api_key}&units={self.units}")
-        if resp.ok:
-            data = resp.json()
+    def get_condition_map(self):
+        """
+        Gets the descriptions of the weather condition codes, loading them on first use.
+
+        Returns:
+            (dict): Condition descriptions keyed by condition code
+        """
 
-            self.logger.debug(f"{data}")
-            return data
+        if self.condition_map is None:
+            self.condition_map = load_lookup(os.path.join(os.path.dirname(__file__), "weather_conditions"))
 
-        return None
+        return self.condition_map
+
+    def get_location_key(self, location=None):
+        """
+        Gets the coordinates for a location.
+
+        Args:
+            location (str): Name of the location.  Uses the default lat/lon if not in the configured locations. (optional)
+
+        Returns:
+            (tuple): Latitude, longitude, and units
+        """
+
+        lat, lon = self.locations.get(str(location).lower().strip(), (self.lattitude, self.longitude))
+        return (lat, lon, self.units)
+
+    def get_location_keys(self):
+        """
+        Gets the coordinates of the default location and every configured location.
+
+        Returns:
+            (list): Unique (latitude, longitude, units) keys
+        """
+
+        keys = {}
+        if self.lattitude is not None and self.longitude is not None:
+            keys[self.get_location_key()] = True
+
+        for name in self.locations:
+            keys[self.get_location_key(name)] = True
+
+        return list(keys)
+
+    def get_data(self, location=None):
+        """
+        Gets the current weather conditions.  Responses are cached for cache_ttl seconds and
+        concurrent requests for the same location share a single download.  Once the cached
+        data expires it is still returned for up to cache_max_stale seconds while it is being
+        refreshed in the background.
+
+        Args:
+            location (str): Name of the location (e.g. context.location) (optional)
+
+        Returns:
+            (dict): Current weather data or None if unavailable
+        """
+
+        key = self.get_location_key(location)
+        if key[0] is None or key[1] is None:
+            return None
+
+        now = time.time()
+
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None and now - cached[0] < self.cache_ttl + self.cache_max_stale:
+                self.cache_hits += 1
+
+                if now - cached[0] >= self.cache_ttl:
+                    threading.Thread(target=self.refresh_data, args=(key,), daemon=True).start()
+
+                return cached[1]
+
+            self.cache_misses += 1
+
+            event = self._inflight.get(key)
+            is_leader = event is None
+            if is_leader:
+                event = threading.Event()
+                self._inflight[key] = event
+
+        if is_leader:
+            self.download_data(key)
+        else:
+            event.wait(self.timeout)
+
+        with self._cache_lock:
+            cached = self._cache.get(key)
+
+        return cached[1] if cached is not None else None
+
+    def refresh_data(self, key):
+        """
+        Downloads the current weather conditions unless a download for the same key is already running.
+
+        Args:
+            key (tuple): Latitude, longitude, and units
+        """
+
+        with self._cache_lock:
+            if key in self._inflight:
+                return
+
+            self._inflight[key] = threading.Event()
+
+        self.download_data(key)
+
+    def get_forecast(self, location=None):
+        """
+        Gets the latest forecast downloaded by the prefetch thread.
+
+        Args:
+            location (str): Name of the location (optional)
+
+        Returns:
+            (dict): Forecast data or None if unavailable
+        """
+
+        return self.forecasts.get(self.get_location_key(location))
+
+    def start_prefetch(self):
+        """
+        Downloads the current conditions (and optionally the forecast) for every location on a
+        schedule so that intents can be answered from memory.
+        """
+
+        while not self._stop_event.is_set():
+            keys = self.get_location_keys()
+
+            if len(keys) > 0:
+                with ThreadPoolExecutor(max_workers=min(len(keys), 8)) as executor:
+                    list(executor.map(self.refresh_data, keys))
+
+                    if self.prefetch_forecast:
+                        list(executor.map(self.download_forecast, keys))
+
+            self._stop_event.wait(self.prefetch_interval)
+
+    def download_forecast(self, key):
+        """
+        Downloads the forecast for a location.
+
+        Args:
+            key (tuple): Latitude, longitude, and units
+        """
+
+        lat, lon, units = key
+
+        try:
+            resp = requests.get(
+                f"{self.api_url}/forecast?lat={lat}&lon={lon}&appid={self.api_key}&units={units}",
+                timeout=self.timeout
+            )
+
+            if resp.ok:
+                self.forecasts[key] = resp.json()
+            else:
+                self.logger.error(f"Unable to retrieve weather forecast: {resp.status_code}")
+
+        except requests.RequestException as e:
+            self.logger.error(f"Unable to retrieve weather forecast: {str(e)}")
+
+    def download_data(self, key):
+        """
+        Downloads the current weather conditions and stores them in the cache.
+
+        Args:
+            key (tuple): Latitude, longitude, and units
+        """
+
+        lat, lon, units = key
+
+        try:
+            resp = requests.get(
+                f"{self.api_url}/weather?lat={lat}&lon={lon}&appid={self.api_key}&units={units}",
+                timeout=self.timeout
+            )
+
+            if resp.ok:
+                data = resp.json()
+
+                self.logger.debug(f"{data}")
+                with self._cache_lock:
+                    self._cache[key] = (time.time(), data)
+            else:
+                self.logger.error(f"Unable to retrieve weather data: {resp.status_code}")
+
+        except requests.RequestException as e:
+            self.logger.error(f"Unable to retrieve weather data: {str(e)}")
+
+        finally:
+            with self._cache_lock:
+                event = self._inflight.pop(key, None)
+
+            if event is not None:
+                event.set()
+
+        self.logger.debug(f"Weather cache hits: {self.cache_hits}, misses: {self.cache_misses}")
+
+    def format_weather(self, data):
+        """
+        Builds the spoken weather summary.
+
+        Args:
+            data (dict): Current weather data from openweathermap.org
+
+        Returns:
+            (str): Weather summary or None if the temperature is missing
+        """
+
+        main = data.get("main") or {}
+        weather = data.get("weather") or [{}]
+        wind = data.get("wind") or {}
+
+        temperature = main.get("temp")
+        if temperature is None:
+            return None
+
+        wind_speed = wind.get("speed") or 0
+        wind_gust = wind.get("gust") or 0
+
+        # Imperial speeds are in miles per hour and the others are in meters per second
+        if self.units == "imperial":
+            units = "miles per hour"
+            factor = 1
+        else:
+            units = "kilometers per hour"
+            factor = 3.6
+
+        conditions = self.get_condition_map().get(str(weather[0].get("id")))
+        direction = get_compass_direction(wind.get("deg"))
+
+        parts = {"temperature": int(temperature), "conditions": "", "wind": "", "direction": "", "gust": ""}
+        if conditions:
+            parts["conditions"] = WEATHER_CLAUSES["conditions"].format(conditions=conditions)
+
+        speed = int(wind_speed * factor)
+        if speed >= 5:
+            parts["wind"] = WEATHER_CLAUSES["wind"].format(speed=speed, units=units)
+
+            if direction is not None:
+                parts["direction"] = WEATHER_CLAUSES["direction"].format(direction=direction)
+
+            if wind_gust > 20 and wind_gust / wind_speed > 2:
+                parts["gust"] = WEATHER_CLAUSES["gust"].format(gust=int(wind_gust * factor), units=units)
+
+        return WEATHER_TEMPLATE.format(**parts)
 
     def handle_temperature_intent(self, message, context=None, **kwargs):
         """
@@ -80,7 +414,7 @@ class WeatherSkill(GenericSkill):
             (bool): True on success or False on failure
         """
 
-        data = self.get_data()
+        data = self.get_data(context.location if context is not None else None)
 
         if data is not None:
             temperature = data.get("main", {}).get("temp", None)
@@ -102,71 +436,12 @@ class WeatherSkill(GenericSkill):
             (bool): True on success or False on failure
         """
 
-        data = self.get_data()
+        data = self.get_data(context.location if context is not None else None)
 
         if data is not None:
-            temperature = data.get("main", {}).get("temp", None)
-            if temperature is not None:
-                temperature = int(temperature)
-                conditions = ""
-                if len(data.get("weather", [])) > 0 and data.get("weather", [])[0].get("id", "-1") in self.condition_map:
-                    conditions = self.condition_map.get(data.get("weather", [])[0].get("id", "-1"))
-
-                if conditions != "":
-                    conditions = f"with {conditions}"
-
-            wind_details = ""
-            wind_speed = data.get("wind", {}).get("speed", 0)
-            if self.units == "imperial":
-                wind_speed = int(wind_speed)
-                units = "miles per hour"
-            else:
-                units = "kilometers per hour"
-                wind_speed = int(wind_speed * 3.6)
-
-            if wind_speed >= 5:
-                
-                wind_details = f". The wind is blowing at about {int(data.get('wind').get('speed', 0))} {units} "
-
-                if data.get("wind", {}).get("deg", -1) <= 15 or data.get("wind", {}).get("deg", -1) > 345:
-                    wind_details = f"{wind_details} from the north"
-                elif data.get("wind", {}).get("deg", -1) <= 35:
-                    wind_details = f"{wind_details} from the north/northeast"
-                elif data.get("wind", {}).get("deg", -1) <= 55:
-                    wind_details = f"{wind_details} from the northeast"
-                elif data.get("wind", {}).get("deg", -1) <= 75:
-                    wind_details = f"{wind_details} from the east/northeast"
-                elif data.get("wind", {}).get("deg", -1) <= 105:
-                    wind_details = f"{wind_details} from the east"
-                elif data.get("wind", {}).get("deg", -1) <= 125:
-                    wind_details = f"{wind_details} from the east/southeast"
-                elif data.get("wind", {}).get("deg", -1) <= 145:
-                    wind_details = f"{wind_details} from the southeast"
-                elif data.get("wind", {}).get("deg", -1) <= 165:
-                    wind_details = f"{wind_details} from the south/southeast"
-                elif data.get("wind", {}).get("deg", -1) <= 195:
-                    wind_details = f"{wind_details} from the south"
-                elif data.get("wind", {}).get("deg", -1) <= 215:
-                    wind_details = f"{wind_details} from the south/southwest"
-                elif data.get("wind", {}).get("deg", -1) <= 235:
-                    wind_details = f"{wind_details} from the southwest"
-                elif data.get("wind", {}).get("deg", -1) <= 255:
-                    wind_details = f"{wind_details} from the west/southwest"
-                elif data.get("wind", {}).get("deg", -1) <= 285:
-                    wind_details = f"{wind_details} from the west"
-                elif data.get("wind", {}).get("deg", -1) <= 305:
-                    wind_details = f"{wind_details} from the west/northwest"
-                elif data.get("wind", {}).get("deg", -1) <= 325:
-                    wind_details = f"{wind_details} from the northwest"
-                elif data.get("wind", {}).get("deg", -1) <= 345:
-                    wind_details = f"{wind_details} from the north/northwest"
-
-                if data.get("wind", {}).get("gust", 0) > 20 \
-                        and (data.get("wind", {}).get("gust", data.get("wind", {}).get("speed")) / data.get("wind", {}).get("speed", 1)) > 2:
-                    wind_details = f"{wind_details} with gusts up to {data.get('wind', {}).get('gust')}"
-
-            weather_line = f"The temperature is {temperature} degrees {conditions}{wind_details}."
-            return self.say(weather_line, context=context)
+            weather_line = self.format_weather(data)
+            if weather_line is not None:
+                return self.say(weather_line, context=context)
 
         return self.say("I was unable to retrieve current weather data.", context=context)
 
@@ -177,6 +452,12 @@ class WeatherSkill(GenericSkill):
         Returns:
             (bool):  True on success and False on failure
         """
+
+        self._stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
         return True
 
 
@@ -0,0 +1,8 @@
+import os
+import sys
+
+root_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Same layout as build.py: the skills in src and a kenzy checkout next to this repository
+sys.path.insert(0, os.path.join(os.path.normpath(os.path.join(root_folder, "..", "kenzy")), "src"))
+sys.path.insert(0, os.path.join(root_folder, "src"))
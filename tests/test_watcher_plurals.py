@@ -0,0 +1,65 @@
+import os
+import pytest
+
+pytest.importorskip("kenzy")
+
+import WatcherSkill  # noqa: E402
+from WatcherSkill import load_lookup, make_plural, make_singular  # noqa: E402
+
+# Object labels of the COCO trained detection models
+COCO_LABELS = [
+    "person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck", "boat", "traffic light",
+    "fire hydrant", "street sign", "stop sign", "parking meter", "bench", "bird", "cat", "dog", "horse", "sheep",
+    "cow", "elephant", "bear", "zebra", "giraffe", "hat", "backpack", "umbrella", "shoe", "eye glasses",
+    "handbag", "tie", "suitcase", "frisbee", "skis", "snowboard", "sports ball", "kite", "baseball bat",
+    "baseball glove", "skateboard", "surfboard", "tennis racket", "bottle", "plate", "wine glass", "cup", "fork",
+    "knife", "spoon", "bowl", "banana", "apple", "sandwich", "orange", "broccoli", "carrot", "hot dog", "pizza",
+    "donut", "cake", "chair", "couch", "potted plant", "bed", "mirror", "dining table", "window", "desk",
+    "toilet", "door", "tv", "laptop", "mouse", "remote", "keyboard", "cell phone", "microwave", "oven",
+    "toaster", "sink", "refrigerator", "blender", "book", "clock", "vase", "scissors", "teddy bear",
+    "hair drier", "toothbrush", "hair brush"
+]
+
+PLURALS = load_lookup(os.path.join(os.path.dirname(WatcherSkill.__file__), "plurals"))
+
+
+@pytest.fixture(scope="module")
+def skill():
+    return WatcherSkill.create_skill()
+
+
+@pytest.mark.parametrize("label", COCO_LABELS)
+def test_label_round_trip(skill, label):
+    assert skill.get_singular(skill.get_plural(label)) == label
+
+
+@pytest.mark.parametrize("label", [x for x in COCO_LABELS if x not in PLURALS])
+def test_rule_round_trip(label):
+    assert make_singular(make_plural(label)) == label
+
+
+@pytest.mark.parametrize("singular, plural", [
+    ("giraffe", "giraffes"),
+    ("baseball glove", "baseball gloves"),
+    ("microwave", "microwaves"),
+    ("knife", "knives"),
+    ("cookie", "cookies"),
+    ("tie", "ties"),
+    ("baby", "babies"),
+    ("toy", "toys"),
+    ("box", "boxes"),
+    ("dish", "dishes"),
+    ("horse", "horses"),
+    ("wine glass", "wine glasses"),
+    ("mouse", "mice")
+])
+def test_rules(singular, plural):
+    assert make_plural(singular) == plural
+    assert make_singular(plural) == singular
+
+
+def test_overrides(skill):
+    assert skill.get_plural("bus") == "buses"
+    assert skill.get_singular("buses") == "bus"
+    assert skill.get_plural("scissors") == "scissors"
+    assert skill.get_singular("Teddy Bears ") == "teddy bear"
@@ -0,0 +1,102 @@
+import pytest
+
+pytest.importorskip("kenzy")
+
+import WeatherSkill  # noqa: E402
+from WeatherSkill import get_compass_direction  # noqa: E402
+
+
+def ladder_direction(deg):
+    """
+    Wind direction as computed by the original if/elif ladder in handle_weather_intent.
+    """
+
+    points = [
+        (15, "north"), (35, "north/northeast"), (55, "northeast"), (75, "east/northeast"),
+        (105, "east"), (125, "east/southeast"), (145, "southeast"), (165, "south/southeast"),
+        (195, "south"), (215, "south/southwest"), (235, "southwest"), (255, "west/southwest"),
+        (285, "west"), (305, "west/northwest"), (325, "northwest"), (345, "north/northwest")
+    ]
+
+    if deg > 345:
+        return "north"
+
+    for bound, point in points:
+        if deg <= bound:
+            return point
+
+
+@pytest.fixture
+def skill():
+    return WeatherSkill.create_skill()
+
+
+def weather(temp=20.0, speed=0, gust=None, deg=None, condition_id=800):
+    data = {"main": {"temp": temp}, "weather": [{"id": condition_id}], "wind": {"speed": speed}}
+    if gust is not None:
+        data["wind"]["gust"] = gust
+    if deg is not None:
+        data["wind"]["deg"] = deg
+    return data
+
+
+@pytest.mark.parametrize("deg", [x / 2 for x in range(0, 721)])
+def test_compass_matches_ladder(deg):
+    assert get_compass_direction(deg) == ladder_direction(deg)
+
+
+@pytest.mark.parametrize("deg, direction", [
+    (0, "north"),
+    (15, "north"),
+    (15.5, "north/northeast"),
+    (90, "east"),
+    (180, "south"),
+    (270, "west"),
+    (345, "north/northwest"),
+    (345.5, "north"),
+    (360, "north")
+])
+def test_compass_boundaries(deg, direction):
+    assert get_compass_direction(deg) == direction
+
+
+@pytest.mark.parametrize("deg", [None, -1, -90, "north"])
+def test_compass_invalid(deg):
+    assert get_compass_direction(deg) is None
+
+
+def test_missing_temperature(skill):
+    assert skill.format_weather({"main": {}, "weather": [{"id": 800}]}) is None
+    assert skill.format_weather({}) is None
+
+
+def test_calm(skill):
+    assert skill.format_weather(weather(temp=28.7, speed=2)) == "The temperature is 28 degrees with clear skies."
+
+
+def test_unknown_condition(skill):
+    assert skill.format_weather(weather(condition_id=999)) == "The temperature is 20 degrees."
+
+
+@pytest.mark.parametrize("deg", [None, -1])
+def test_missing_direction(skill, deg):
+    text = skill.format_weather(weather(speed=10, deg=deg))
+    assert text == "The temperature is 20 degrees with clear skies. The wind is blowing at about 10 miles per hour."
+
+
+@pytest.mark.parametrize("units, speed, gust, expected", [
+    ("imperial", 4.9, None, "The temperature is 20 degrees with clear skies."),
+    ("imperial", 10, None, "The temperature is 20 degrees with clear skies. The wind is blowing at about 10 miles per hour from the west."),
+    ("imperial", 10, 25, "The temperature is 20 degrees with clear skies. The wind is blowing at about 10 miles per hour from the west "
+                         "with gusts up to 25 miles per hour."),
+    ("imperial", 15, 25, "The temperature is 20 degrees with clear skies. The wind is blowing at about 15 miles per hour from the west."),
+    ("metric", 1.3, None, "The temperature is 20 degrees with clear skies."),
+    ("metric", 1.5, None, "The temperature is 20 degrees with clear skies. The wind is blowing at about 5 kilometers per hour from the west."),
+    ("metric", 10, None, "The temperature is 20 degrees with clear skies. The wind is blowing at about 36 kilometers per hour from the west."),
+    ("metric", 10, 25, "The temperature is 20 degrees with clear skies. The wind is blowing at about 36 kilometers per hour from the west "
+                       "with gusts up to 90 kilometers per hour."),
+    ("standard", 10, None, "The temperature is 20 degrees with clear skies. The wind is blowing at about 36 kilometers per hour from the west.")
+])
+def test_units(skill, units, speed, gust, expected):
+    skill.units = units
+    assert skill.format_weather(weather(speed=speed, gust=gust, deg=270)) == expected